@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'simple_votings.settings')
+os.environ.setdefault('ROOT_URLCONF', 'simple_votings.asgi_urls')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from simple_votings_app.live import LiveResultsApplication  # noqa: E402
+
+application = LiveResultsApplication(django_application)
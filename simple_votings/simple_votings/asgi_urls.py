@@ -0,0 +1,16 @@
+"""URL configuration of the ASGI application
+
+Serves the async versions of the voting page, vote, like and export views
+on the same paths, everything else falls through to simple_votings.urls.
+"""
+from django.urls import include, path
+
+from simple_votings_app import async_views
+
+urlpatterns = [
+    path('voting/<int:voting_id>/', async_views.voting),
+    path('vote/<int:answer>/', async_views.vote),
+    path('like/<int:voting_id>/', async_views.like),
+    path('voting/<int:voting_id>/export/', async_views.export_voting),
+    path('', include('simple_votings.urls')),
+]
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'simple_votings_app.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,7 +52,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'simple_votings.urls'
+# asgi.py switches to simple_votings.asgi_urls, which serves async views
+ROOT_URLCONF = os.environ.get('ROOT_URLCONF', 'simple_votings.urls')
 
 TEMPLATES = [
     {
@@ -74,13 +76,125 @@ WSGI_APPLICATION = 'simple_votings.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
+# DB_PROFILE selects the database configuration:
+#   development - plain SQLite file
+#   production  - the same file tuned for concurrent requests: WAL journal,
+#                 the SQLITE_PRAGMAS below applied to every new connection,
+#                 write transactions that wait for the lock and persistent
+#                 connections
+#   postgres    - PostgreSQL from the POSTGRES_* variables with a connection
+#                 pool (needs psycopg[pool])
+
+DB_PROFILE = os.environ.get('DB_PROFILE', 'development')
+
+if DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'simple_votings'),
+            'USER': os.environ.get('POSTGRES_USER', 'simple_votings'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Connections are reused through the pool, CONN_MAX_AGE must stay 0
+            'OPTIONS': {
+                'pool': {
+                    'min_size': 2,
+                    'max_size': int(os.environ.get('POSTGRES_POOL_SIZE', '20')),
+                    'timeout': 10,
+                },
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        }
+    }
+
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock when the transaction starts, a deferred
+            # transaction that reads first can not wait for it and fails with
+            # "database is locked" at once
+            'transaction_mode': 'IMMEDIATE',
+        },
+    })
+
+# Read-only replicas of the default database, safe requests read from them
+# through simple_votings_app.replicas.ReplicaRouter. Set POSTGRES_REPLICA_HOSTS
+# (comma separated) with the postgres profile, or SQLITE_REPLICAS to try it
+# locally with copies of the SQLite file kept by "manage.py sync_replicas"
+
+if DB_PROFILE == 'postgres':
+    replicas = [{'HOST': host} for host in os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',') if host]
+else:
+    replicas = [{'NAME': name} for name in os.environ.get('SQLITE_REPLICAS', '').split(',') if name]
+
+for number, replica in enumerate(replicas, 1):
+    DATABASES['replica{}'.format(number)] = dict(DATABASES['default'], TEST={'MIRROR': 'default'}, **replica)
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['simple_votings_app.replicas.ReplicaRouter']
+
+# A client reads from the default database for so many seconds after
+# a vote, like or comment, so that it sees it before the replicas catch up
+REPLICA_STICKY_SECONDS = 5
+
+# Applied by simple_votings_app.models.tune_sqlite to every new SQLite connection
+SQLITE_PRAGMAS = {}
+
+if DB_PROFILE == 'production':
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'wal',
+        # Durable at checkpoints only, safe from corruption in WAL mode
+        'synchronous': 'normal',
+        # Negative is in KiB, 64 MB per connection
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'memory',
+        # Milliseconds to wait for a lock before "database is locked"
+        'busy_timeout': 5000,
+    }
+
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
 
-DATABASES = {
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# Set CACHE_BACKEND to e.g. django.core.cache.backends.filebased.FileBasedCache
+# and CACHE_LOCATION to a directory to share the cache between processes
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'simple-votings'),
     }
 }
+# The local memory and file caches keep 300 entries by default, fewer than
+# the results and cards of a busy front page
+if CACHES['default']['BACKEND'].endswith(('.LocMemCache', '.FileBasedCache')):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', '10000'))}
+
+# Cached results are keyed by the voting version, so they never get stale
+# and the timeout only limits memory usage
+RESULTS_CACHE_TIMEOUT = 60 * 60
+# Same for the rendered voting cards of the front page and search
+CARD_CACHE_TIMEOUT = 60 * 60
+
+
+# Write-behind vote ingestion for hot polls: votes are queued in memory and
+# inserted with bulk_create every VOTE_BUFFER_BATCH_SIZE votes or
+# VOTE_BUFFER_FLUSH_INTERVAL seconds, whichever comes first
+
+VOTE_BUFFER = os.environ.get('VOTE_BUFFER', '') == '1'
+VOTE_BUFFER_BATCH_SIZE = 500
+VOTE_BUFFER_FLUSH_INTERVAL = 0.5
 
 
 # Password validation
@@ -126,6 +240,29 @@ STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Live results (ASGI only): the versions of the votings someone listens to
+# are read every LIVE_POLL_INTERVAL seconds, idle streams get a comment
+# every LIVE_HEARTBEAT seconds
+
+LIVE_POLL_INTERVAL = 1.0
+LIVE_HEARTBEAT = 15
+
+# The weight of a vote, like or comment in the hot ranking halves every
+# HOT_HALF_LIFE seconds. Run rebuild_hot_scores after changing it
+
+HOT_HALF_LIFE = 12 * 60 * 60
+
+# Deleted votings are purged by a background thread in chunks of
+# PURGE_CHUNK_SIZE rows, sleeping PURGE_PAUSE seconds between chunks so
+# that other requests can take the database write lock
+
+PURGE_CHUNK_SIZE = 1000
+PURGE_PAUSE = 0.05
+
+# Avatars are resized to these sizes (in px) by a pool of worker threads
+AVATAR_SIZES = (32, 64, 200)
+AVATAR_WORKERS = 2
+
 LOGIN_URL = '/login/'
 LOGOUT_URL = '/'
 LOGIN_REDIRECT_URL = '/'
@@ -0,0 +1,96 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseForbidden
+from django.shortcuts import render, redirect, aget_object_or_404, HttpResponse
+
+from .models import VotingAnswer, Voting
+from .models import Like, Comment
+from .forms import AddCommentForm
+from .results import aget_voting_results
+from .views import get_client_ip, voted_answer_ids, voter_votes, new_vote, store_vote, comments_page
+from .views import export_voting as sync_export_voting
+from .export import read_in_chunks
+
+# Async versions of the hottest views, served by the ASGI application
+# (see simple_votings/asgi_urls.py). They must behave like their
+# counterparts in views.py.
+
+
+async def voting(request, voting_id):
+    voting_item = await aget_object_or_404(Voting.objects.select_related('user'), id=voting_id, is_deleted=False)
+    user = await request.auser()
+
+    if request.method == 'POST':
+        if not user.is_authenticated:
+            return redirect('/login/')
+
+        form = AddCommentForm(request.POST)
+        if form.is_valid():
+            await Comment.objects.acreate(
+                text=form.cleaned_data['comment'],
+                voting=voting_item,
+                user=user
+            )
+        return redirect('/voting/' + str(voting_id))
+
+    context = {}
+    context['voting'] = voting_item
+    context['results'] = await aget_voting_results(voting_item)
+    context['form'] = AddCommentForm()
+    context['voted_answers'] = {
+        answer_id async for answer_id in voted_answer_ids(voting_item, user, get_client_ip(request))
+    }
+    context['liked_by_user'] = user.is_authenticated and await Like.objects.filter(
+        user=user,
+        voting=voting_item
+    ).aexists()
+    context['comments'], context['next_comments'] = await sync_to_async(comments_page)(voting_item, request)
+    # The page subscribes to the event stream served by simple_votings.asgi
+    context['live'] = True
+
+    # Context processors (e.g. auth) still touch the database synchronously
+    return await sync_to_async(render)(request, 'voting.html', context)
+
+
+async def vote(request, answer):
+    answer_item = await aget_object_or_404(
+        VotingAnswer.objects.select_related('voting'),
+        id=answer,
+        voting__is_deleted=False
+    )
+
+    if request.method == 'POST':
+        user = await request.auser()
+        ip = get_client_ip(request)
+        if user.is_authenticated:
+            voted = voter_votes(answer_item, user=user)
+        else:
+            user = None
+            voted = voter_votes(answer_item, user_ip=ip)
+
+        if answer_item.voting.is_ended():
+            return HttpResponseForbidden('Голосование завершено.')
+
+        if await voted.aexists() or not await sync_to_async(store_vote)(new_vote(answer_item, user, ip)):
+            return HttpResponse('Вы уже проголосовали.', status=409)
+
+    return redirect('/voting/' + str(answer_item.voting_id))
+
+
+@login_required
+async def like(request, voting_id):
+    if request.method == 'POST':
+        user = await request.auser()
+        voting_item = await aget_object_or_404(Voting, id=voting_id, is_deleted=False)
+        deleted, _ = await Like.objects.filter(voting=voting_item, user=user).adelete()
+        if not deleted:
+            await Like.objects.acreate(voting=voting_item, user=user)
+
+    return redirect('/voting/' + str(voting_id))
+
+
+async def export_voting(request, voting_id):
+    response = await sync_to_async(sync_export_voting)(request, voting_id)
+    if response.streaming:
+        response.streaming_content = read_in_chunks(response.streaming_content)
+    return response
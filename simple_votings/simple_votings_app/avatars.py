@@ -0,0 +1,56 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+
+from PIL import Image, ImageOps
+
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+# Resizing is CPU bound and must not run inside the request
+executor = ThreadPoolExecutor(max_workers=settings.AVATAR_WORKERS, thread_name_prefix='avatars')
+
+
+def make_rendition(image, size):
+    rendition = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    data = BytesIO()
+    rendition.save(data, 'WEBP', quality=85)
+    return data.getvalue()
+
+
+def process_avatar(profile_id, name):
+    try:
+        with default_storage.open(name) as file:
+            image = ImageOps.exif_transpose(Image.open(file))
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        renditions = {}
+        for size in settings.AVATAR_SIZES:
+            data = make_rendition(image, size)
+            # Content hashed names never change, so they can be cached forever
+            path = 'avatars/{}/{}-{}.webp'.format(profile_id, hashlib.sha256(data).hexdigest()[:16], size)
+            if not default_storage.exists(path):
+                default_storage.save(path, ContentFile(data))
+            renditions[str(size)] = path
+
+        old_renditions = Profile.objects.filter(id=profile_id).values_list('avatar_renditions', flat=True).first()
+        # The user may have uploaded another avatar in the meantime
+        if Profile.objects.filter(id=profile_id, avatar=name).update(avatar_renditions=renditions):
+            for path in (old_renditions or {}).values():
+                if path not in renditions.values():
+                    default_storage.delete(path)
+    except Exception:
+        logger.exception('Could not process avatar %s of profile %s', name, profile_id)
+    finally:
+        connection.close()
+
+
+def schedule_avatar_processing(profile_id, name):
+    return executor.submit(process_avatar, profile_id, name)
@@ -0,0 +1,24 @@
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+
+from .models import Voting, VotingAnswer
+
+
+def percentile(timings, p):
+    # Nearest rank on sorted timings
+    return timings[max(0, -(-len(timings) * p // 100) - 1)]
+
+
+def bench_author():
+    """The user that owns the votings of the benchmarks."""
+    author = User.objects.filter(is_superuser=True).first() or User.objects.first()
+    if author is None:
+        raise CommandError('Create a user first')
+    return author
+
+
+def bench_voting(author, **fields):
+    """Creates a voting with four answers for a benchmark, the caller deletes it."""
+    voting = Voting.objects.create(text='Benchmark', user=author, is_anonymous_allowed=True, **fields)
+    answers = [VotingAnswer.objects.create(text=str(i), voting=voting) for i in range(4)]
+    return voting, answers
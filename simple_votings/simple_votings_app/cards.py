@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+
+def card_key(voting):
+    return 'voting-card:{}:{}'.format(voting.id, voting.version)
+
+
+def render_cards(votings):
+    """
+    HTML of the voting_card.html of every voting in votings. The cards are
+    cached by version, which changes on every vote, like, comment and edit,
+    so only the changed ones are rendered and the rest come from a single
+    get_many.
+    """
+    keys = [card_key(voting) for voting in votings]
+    cards = cache.get_many(keys)
+    missing = {
+        key: render_to_string('voting_card.html', {'voting': voting})
+        for key, voting in zip(keys, votings) if key not in cards
+    }
+    if missing:
+        cache.set_many(missing, settings.CARD_CACHE_TIMEOUT)
+        cards.update(missing)
+    return [mark_safe(cards[key]) for key in keys]
@@ -0,0 +1,189 @@
+import math
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Vote, VotingAnswer, Voting
+from .models import Like, Comment, Profile, VoteRollup
+from . import hot
+from .hot import hot_increment
+from .models import new_version, add_vote_rollups, vote_hour, vote_hour_expression
+
+
+def count_subquery(queryset, field, outer='pk'):
+    counted = queryset.filter(**{field: OuterRef(outer)}).order_by().values(field)
+    counted = counted.annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+@transaction.atomic
+def rebuild_voting_counters(votings=None):
+    answers = VotingAnswer.objects.all()
+    if votings is None:
+        votings = Voting.objects.all()
+    else:
+        answers = answers.filter(voting__in=votings)
+        votings = Voting.objects.filter(id__in=votings)
+
+    answers.update(votes_total=count_subquery(Vote.objects.all(), 'answer'))
+    votings.update(
+        votes_total=count_subquery(Vote.objects.all(), 'voting'),
+        likes_total=count_subquery(Like.objects.all(), 'voting'),
+        comments_total=count_subquery(Comment.objects.all(), 'voting'),
+    )
+
+
+@transaction.atomic
+def rebuild_profile_stats(users=None):
+    profiles = Profile.objects.all()
+    if users is not None:
+        profiles = profiles.filter(user__in=users)
+
+    profiles.update(
+        votings_total=count_subquery(Voting.objects.filter(is_deleted=False), 'user', 'user'),
+        votes_total=count_subquery(Vote.objects.all(), 'user', 'user'),
+        likes_total=count_subquery(Like.objects.all(), 'user', 'user'),
+        comments_total=count_subquery(Comment.objects.all(), 'user', 'user'),
+        likes_on_votings_total=count_subquery(Like.objects.all(), 'voting__user', 'user'),
+        votes_on_votings_total=count_subquery(Vote.objects.all(), 'voting__user', 'user'),
+    )
+
+
+@transaction.atomic
+def rebuild_hot_scores(since):
+    """
+    Recalculates hot_score of the votings created or active since the given
+    time from their votes, likes and comments since then. Returns the number
+    of votings updated.
+    """
+    # Sums of weight * 2 ** (t - now), which stay below the weights, so
+    # score = now + log2(sum)
+    now = hot.hot_time()
+    sums = defaultdict(float)
+    for voting_id, start_time in Voting.objects.filter(start_time__gte=since).values_list('id', 'start_time'):
+        sums[voting_id] += 2 ** (hot.hot_time(start_time) - now)
+    for model, weight in ((Vote, hot.VOTE), (Like, hot.LIKE), (Comment, hot.COMMENT)):
+        rows = model.objects.filter(date__gte=since).values_list('voting', 'date')
+        for voting_id, date in rows.iterator(chunk_size=10000):
+            sums[voting_id] += weight * 2 ** (hot.hot_time(date) - now)
+
+    # bulk_update builds a CASE per row, many times slower for every voting of a site
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'UPDATE {} SET hot_score = %s WHERE id = %s'.format(Voting._meta.db_table),
+            [(now + math.log2(total), voting_id) for voting_id, total in sums.items()]
+        )
+    return len(sums)
+
+
+def rebuild_vote_rollups(chunk_size=1000, progress=None):
+    """
+    Recounts the vote rollups from the votes, chunk_size votings per
+    transaction so that voting goes on meanwhile. Returns the number of rollups.
+    """
+    total = 0
+    last_id = 0
+    while True:
+        votings = list(Voting.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not votings:
+            return total
+        last_id = votings[-1]
+        with transaction.atomic():
+            VoteRollup.objects.filter(voting__in=votings).delete()
+            hours = Vote.objects.filter(voting__in=votings).annotate(hour=vote_hour_expression('date'))
+            hours = hours.values_list('answer', 'voting', 'hour').annotate(votes=Count('id')).order_by()
+            rollups = VoteRollup.objects.bulk_create([
+                VoteRollup(answer_id=answer_id, voting_id=voting_id, hour=hour, votes=votes)
+                for answer_id, voting_id, hour, votes in hours
+            ], batch_size=1000)
+        total += len(rollups)
+        if progress is not None:
+            progress(last_id, total)
+
+
+def add_counts(queryset, field, counts, key='id', **extra):
+    # One UPDATE per distinct delta instead of one per row
+    keys_by_delta = defaultdict(list)
+    for value, delta in counts.items():
+        if delta:
+            keys_by_delta[delta].append(value)
+    for delta, values in keys_by_delta.items():
+        # Callable extra values depend on the delta
+        updates = {name: value(delta) if callable(value) else value for name, value in extra.items()}
+        queryset.filter(**{key + '__in': values}).update(**{field: F(field) + delta}, **updates)
+
+
+def votes_created(votes):
+    """Updates counters for votes inserted with bulk_create, which sends no signals."""
+    votings = Counter(vote.voting_id for vote in votes)
+    add_counts(VotingAnswer.objects.all(), 'votes_total', Counter(vote.answer_id for vote in votes))
+    add_vote_rollups(Counter((vote.answer_id, vote.voting_id, vote_hour(vote.date)) for vote in votes))
+    add_counts(Voting.objects.all(), 'votes_total', votings, **new_version(),
+               hot_score=lambda delta: hot_increment(hot.VOTE * delta))
+    add_counts(Profile.objects.all(), 'votes_total', Counter(vote.user_id for vote in votes if vote.user_id), 'user')
+
+    owners = Counter()
+    for user_id, voting_id in Voting.objects.filter(id__in=votings).values_list('user', 'id'):
+        owners[user_id] += votings[voting_id]
+    add_counts(Profile.objects.all(), 'votes_on_votings_total', owners, 'user')
+
+
+def subtract_counts(queryset, field, rows, lookup, outer='pk', **extra):
+    # A single UPDATE however many rows are about to be deleted
+    queryset.filter(**{outer + '__in': rows.values(lookup)}).update(
+        **{field: F(field) - count_subquery(rows, lookup, outer)},
+        **extra
+    )
+
+
+def raw_delete(queryset):
+    # Plain DELETE: neither loads the rows nor sends post_delete, so the
+    # counters have to be updated by the caller
+    return queryset._raw_delete(queryset.db)
+
+
+def subtract_vote_rollups(votes):
+    # A single UPDATE joined to the votes grouped by hour, SQLite (3.33+) and
+    # PostgreSQL both have UPDATE ... FROM. A subquery per rollup would
+    # truncate every vote of the answer for each of its hours. Votes from
+    # before the rollups were built have none to subtract from.
+    hours = votes.annotate(hour=vote_hour_expression('date')).values('answer', 'hour')
+    hours = hours.annotate(votes=Count('id')).order_by()
+    sql, params = hours.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'UPDATE {table} SET votes = {table}.votes - h.votes FROM ({hours}) AS h '
+            'WHERE {table}.answer_id = h.answer AND {table}.hour = h.hour'.format(
+                table=VoteRollup._meta.db_table, hours=sql
+            ),
+            params
+        )
+
+
+@transaction.atomic
+def delete_votes(votes, rollups=True):
+    # rollups=False when the rollups are deleted along with the votes
+    if rollups:
+        subtract_vote_rollups(votes)
+    subtract_counts(VotingAnswer.objects.all(), 'votes_total', votes, 'answer')
+    subtract_counts(Voting.objects.all(), 'votes_total', votes, 'voting', **new_version())
+    subtract_counts(Profile.objects.all(), 'votes_total', votes, 'user', 'user')
+    subtract_counts(Profile.objects.all(), 'votes_on_votings_total', votes, 'voting__user', 'user')
+    return raw_delete(votes)
+
+
+@transaction.atomic
+def delete_likes(likes):
+    subtract_counts(Voting.objects.all(), 'likes_total', likes, 'voting', **new_version())
+    subtract_counts(Profile.objects.all(), 'likes_total', likes, 'user', 'user')
+    subtract_counts(Profile.objects.all(), 'likes_on_votings_total', likes, 'voting__user', 'user')
+    return raw_delete(likes)
+
+
+@transaction.atomic
+def delete_comments(comments):
+    subtract_counts(Voting.objects.all(), 'comments_total', comments, 'voting', **new_version())
+    subtract_counts(Profile.objects.all(), 'comments_total', comments, 'user', 'user')
+    return raw_delete(comments)
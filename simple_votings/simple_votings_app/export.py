@@ -0,0 +1,77 @@
+import csv
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.crypto import salted_hmac
+
+from .models import Vote, VotingAnswer
+
+# Votes fetched from the database at a time, memory does not grow with the voting
+CHUNK_SIZE = 2000
+
+CSV_HEADER = ('type', 'answer_id', 'answer', 'votes', 'date', 'user', 'ip')
+
+
+def hash_ip(ip):
+    # Owners may tell anonymous voters apart but not see their addresses
+    return salted_hmac('simple_votings_app.export.hash_ip', ip).hexdigest()[:16] if ip else ''
+
+
+def export_rows(voting, using):
+    """Yields the answers of voting with their vote counts and then every vote, as dicts."""
+    answers = VotingAnswer.objects.using(using).filter(voting=voting).order_by('id')
+    for answer_id, text, votes in answers.values_list('id', 'text', 'votes_total'):
+        yield {'type': 'answer', 'answer_id': answer_id, 'answer': text, 'votes': votes}
+
+    votes = Vote.objects.using(using).filter(voting=voting).order_by('id')
+    votes = votes.values_list('date', 'answer_id', 'user__username', 'user_ip')
+    for date, answer_id, username, ip in votes.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            'type': 'vote',
+            'answer_id': answer_id,
+            'date': date,
+            'user': username or '',
+            'ip': '' if username else hash_ip(ip),
+        }
+
+
+class Echo:
+    # csv.writer writes into a file, this one hands the line back
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        if 'date' in row:
+            row['date'] = row['date'].isoformat()
+        yield writer.writerow([row.get(field, '') for field in CSV_HEADER])
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+async def read_in_chunks(content, size=CHUNK_SIZE):
+    """
+    Async iterator over the byte strings of content, size at a time read in
+    the request's sync thread, where the database cursor of the rows lives.
+    Django reads a sync iterator to the end before sending anything on ASGI.
+    """
+    content = iter(content)
+    read = sync_to_async(lambda: b''.join(itertools.islice(content, size)))
+    while chunk := await read():
+        yield chunk
+
+
+# format -> (lines, content type)
+FORMATS = {
+    'csv': (csv_lines, 'text/csv; charset=utf-8'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson; charset=utf-8'),
+}
@@ -0,0 +1,31 @@
+import datetime
+
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Log, Power
+from django.utils import timezone
+
+# Scores are kept in log2 space relative to this moment: a voting that got
+# weights w_i at times t_i has hot_score = log2(sum(w_i * 2 ** t_i)) with t_i
+# in half-lives since EPOCH. Every score decays at the same rate, so sorting
+# by the stored column ranks by the decayed score at any moment without
+# rewriting any row, and the logarithm keeps the numbers small.
+EPOCH = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Weights of the activity a voting gets, its creation counts as one vote
+VOTE = 1.0
+LIKE = 2.0
+COMMENT = 3.0
+
+
+def hot_time(when=None):
+    """Half-lives from EPOCH to when (now by default), the score of a single vote then."""
+    return ((when or timezone.now()) - EPOCH).total_seconds() / settings.HOT_HALF_LIFE
+
+
+def hot_increment(weight, when=None):
+    """Expression for hot_score after adding weight at when."""
+    t = hot_time(when)
+    # log2(2 ** score + weight * 2 ** t) = t + log2(weight + 2 ** (score - t)),
+    # the exponent stays small; it is bounded below as PostgreSQL raises on underflow
+    return Value(t) + Log(2, Value(weight) + Power(2, Greatest(F('hot_score') - Value(t), Value(-1000.0))))
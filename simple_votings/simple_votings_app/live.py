@@ -0,0 +1,189 @@
+import asyncio
+import contextvars
+import json
+import logging
+import re
+from contextlib import aclosing
+from http import HTTPStatus
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Voting
+from .results import get_many_voting_results
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PATH = re.compile(r'^/voting/(\d+)/events/$')
+EVENTS_HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    # Stops nginx from buffering the stream
+    (b'x-accel-buffering', b'no'),
+]
+
+
+class Watcher:
+    """Latest results of a voting, shared by all of its subscribers."""
+
+    def __init__(self):
+        self.subscribers = 0
+        self.results = None
+        self.deleted = False
+        # Replaced on every change, so waiting on it is waiting for the next change
+        self.changed = asyncio.Event()
+
+    def publish(self, results=None, deleted=False):
+        self.results = results or self.results
+        self.deleted = deleted
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class LiveResults:
+    """
+    Pushes the results of the watched votings to their subscribers. A single
+    task per process reads the versions of all watched votings every
+    LIVE_POLL_INTERVAL seconds and fetches the results of the changed ones,
+    so the database sees one query a tick however many clients listen, and
+    every vote in between is coalesced into one update.
+    """
+
+    def __init__(self):
+        self.watchers = {}
+        self.task = None
+        self.wakeup = None
+
+    async def subscribe(self, voting_id, last_version=None):
+        """Yields the results of the voting on every change, or None after a heartbeat interval without any."""
+        # Started with the first subscriber, stops with the last one
+        if self.task is None or self.task.done() or self.task.get_loop() is not asyncio.get_running_loop():
+            self.wakeup = asyncio.Event()
+            # In a context of its own, the task must not inherit the request's
+            # (its sync_to_async thread is gone once the request ends)
+            self.task = contextvars.Context().run(asyncio.create_task, self.run())
+
+        watcher = self.watchers.get(voting_id)
+        if watcher is None:
+            watcher = self.watchers[voting_id] = Watcher()
+            # Fetch the first results at once rather than on the next tick
+            self.wakeup.set()
+        watcher.subscribers += 1
+
+        try:
+            version = last_version
+            while not watcher.deleted:
+                changed = watcher.changed
+                if watcher.results is not None and watcher.results['version'] != version:
+                    version = watcher.results['version']
+                    yield watcher.results
+                    continue
+                try:
+                    await asyncio.wait_for(changed.wait(), settings.LIVE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            watcher.subscribers -= 1
+            if not watcher.subscribers:
+                del self.watchers[voting_id]
+
+    async def run(self):
+        while self.watchers:
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception('Polling live results failed')
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), settings.LIVE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    async def poll(self):
+        watchers = dict(self.watchers)
+        changed, deleted = await sync_to_async(changed_votings)(
+            {voting_id: watcher.results and watcher.results['version'] for voting_id, watcher in watchers.items()}
+        )
+        for results in changed:
+            watchers[results['id']].publish(results)
+        for voting_id in deleted:
+            watchers[voting_id].publish(deleted=True)
+
+
+def changed_votings(versions):
+    """Returns (results of the votings whose version differs from versions, ids of the deleted votings)."""
+    # Runs outside of requests, nothing else recycles this thread's connection
+    close_old_connections()
+    votings = Voting.objects.filter(id__in=versions, is_deleted=False)
+    votings = votings.only('id', 'version', 'likes_total', 'comments_total', 'votes_total')
+    current = {voting.id: voting for voting in votings}
+    changed = [voting for voting in current.values() if voting.version != versions[voting.id]]
+    return get_many_voting_results(changed), [voting_id for voting_id in versions if voting_id not in current]
+
+
+class LiveResultsApplication:
+    """
+    ASGI application streaming the results of a voting as Server-Sent Events
+    from /voting/<id>/events/ and passing every other request to application.
+    The streams skip Django's request handling: it would keep a thread for
+    every open request, and idle streams come by the thousand.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        match = scope['type'] == 'http' and EVENTS_PATH.match(scope['path'])
+        if not match:
+            return await self.application(scope, receive, send)
+
+        voting_id = int(match[1])
+        if scope['method'] != 'GET':
+            return await respond(send, 405)
+        if not await Voting.objects.filter(id=voting_id, is_deleted=False).aexists():
+            return await respond(send, 404)
+
+        # A reconnecting client only needs the results if they changed meanwhile
+        last_version = dict(scope['headers']).get(b'last-event-id', b'')
+        last_version = int(last_version) if last_version.isdigit() else None
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': EVENTS_HEADERS})
+        stream = asyncio.create_task(send_events(send, voting_id, last_version))
+        disconnect = asyncio.create_task(wait_for_disconnect(receive))
+        try:
+            await asyncio.wait((stream, disconnect), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stream.cancel()
+            disconnect.cancel()
+            await asyncio.gather(stream, disconnect, return_exceptions=True)
+
+
+async def send_events(send, voting_id, last_version):
+    async with aclosing(live_results.subscribe(voting_id, last_version)) as updates:
+        async for results in updates:
+            await send({'type': 'http.response.body', 'body': server_sent_event(results).encode(), 'more_body': True})
+    # The voting was deleted
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def respond(send, status):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': HTTPStatus(status).phrase.encode()})
+
+
+def server_sent_event(results):
+    if results is None:
+        # A comment, keeps idle connections open through proxies
+        return ': ping\n\n'
+    return 'id: {}\nevent: results\ndata: {}\n\n'.format(
+        results['version'], json.dumps(results, ensure_ascii=False)
+    )
+
+
+live_results = LiveResults()
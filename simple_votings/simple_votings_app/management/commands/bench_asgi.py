@@ -0,0 +1,109 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from simple_votings_app.benchmarks import bench_author, bench_voting
+from simple_votings_app.models import Like, Profile
+
+# Host the test clients send, it must pass ALLOWED_HOSTS
+HOST = 'testserver'
+
+
+class Command(BaseCommand):
+    help = 'Compares concurrent throughput of the sync (WSGI) and async (ASGI) vote, like and voting views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=16)
+
+    def handle(self, *args, **options):
+        author = bench_author()
+
+        # Every like comes from a user of its own, likes of one user toggle
+        likers = User.objects.bulk_create([
+            User(username='bench_asgi_{}'.format(i)) for i in range(options['requests'] // 4)
+        ])
+        Profile.objects.bulk_create([Profile(user=user) for user in likers])
+        cookies = [self.session_cookies(user) for user in likers]
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, HOST]):
+                self.compare(author, cookies, options)
+        finally:
+            Session.objects.filter(session_key__in=[item[settings.SESSION_COOKIE_NAME] for item in cookies]).delete()
+            User.objects.filter(id__in=[user.id for user in likers]).delete()
+
+    def compare(self, author, cookies, options):
+        for stack in ('wsgi', 'asgi'):
+            voting, answers = bench_voting(author)
+            requests = [self.make_request(i, voting, answers, cookies) for i in range(options['requests'])]
+            try:
+                if stack == 'wsgi':
+                    elapsed, statuses = self.run_wsgi(requests, options['concurrency'])
+                else:
+                    with override_settings(ROOT_URLCONF='simple_votings.asgi_urls'):
+                        elapsed, statuses = asyncio.run(self.run_asgi(requests, options['concurrency']))
+                # Error pages are no measure of the views
+                if any(status >= 400 for status in statuses):
+                    raise CommandError('{}: unexpected statuses {}'.format(stack, statuses))
+                # A like redirects to the login page as well when the session is not accepted
+                if Like.objects.filter(voting=voting).count() != len(cookies):
+                    raise CommandError('{}: the likes were not recorded'.format(stack))
+            finally:
+                voting.delete()
+            self.stdout.write('{}: {} requests in {:.2f}s ({:.0f} req/s), statuses {}'.format(
+                stack, len(requests), elapsed, len(requests) / elapsed, statuses
+            ))
+
+    def session_cookies(self, user):
+        client = Client()
+        client.force_login(user)
+        return {settings.SESSION_COOKIE_NAME: client.session.session_key}
+
+    def make_request(self, i, voting, answers, cookies):
+        headers = {'X-Forwarded-For': '10.{}.{}.{}'.format(i >> 16 & 255, i >> 8 & 255, i & 255)}
+        if i % 4 == 3:
+            return 'post', '/like/{}/'.format(voting.id), headers, cookies[i // 4]
+        if i % 2:
+            return 'post', '/vote/{}/'.format(answers[i % len(answers)].id), headers, {}
+        return 'get', '/voting/{}/'.format(voting.id), headers, {}
+
+    def run_wsgi(self, requests, concurrency):
+        def send(request):
+            method, path, headers, cookies = request
+            client = Client()
+            client.cookies.load(cookies)
+            try:
+                return getattr(client, method)(path, headers=headers).status_code
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            statuses = list(executor.map(send, requests))
+        return time.perf_counter() - start, self.summary(statuses)
+
+    async def run_asgi(self, requests, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(request):
+            method, path, headers, cookies = request
+            client = AsyncClient()
+            client.cookies.load(cookies)
+            async with semaphore:
+                response = await getattr(client, method)(path, headers=headers)
+                return response.status_code
+
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*[send(request) for request in requests])
+        return time.perf_counter() - start, self.summary(statuses)
+
+    def summary(self, statuses):
+        return {status: statuses.count(status) for status in sorted(set(statuses))}
@@ -0,0 +1,62 @@
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+
+from simple_votings_app.cards import render_cards
+from simple_votings_app.models import Voting
+
+# What index.html did before the cards were cached
+UNCACHED = engines['django'].from_string(
+    "{% for voting in votings %}{% include 'voting_card.html' %}{% endfor %}"
+)
+CACHED = engines['django'].from_string('{% for card in cards %}{{ card }}{% endfor %}')
+
+
+class Command(BaseCommand):
+    help = 'Compares the render time of a page of voting cards with and without the card cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--changed', type=float, default=0.05,
+                            help='Share of the cards whose voting changes between renders')
+
+    def handle(self, *args, **options):
+        votings = list(Voting.objects.filter(is_deleted=False).order_by('-start_time', '-id')[:options['cards']])
+        if not votings:
+            raise CommandError('Create some votings first, e.g. with generate_data')
+        changed = votings[:int(len(votings) * options['changed'])]
+
+        def uncached():
+            return UNCACHED.render({'votings': votings})
+
+        def cold():
+            cache.clear()
+            return CACHED.render({'cards': render_cards(votings)})
+
+        def warm():
+            return CACHED.render({'cards': render_cards(votings)})
+
+        def partly_changed():
+            # Bumped in memory only, the cards are rendered under new keys
+            for voting in changed:
+                voting.version += 1
+            return warm()
+
+        self.stdout.write('{} cards, median of {} renders'.format(len(votings), options['repeat']))
+        baseline = None
+        for name, render in (('uncached', uncached), ('cold cache', cold), ('warm cache', warm),
+                             ('{:.0%} changed'.format(options['changed']), partly_changed)):
+            render()
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                render()
+                timings.append(time.perf_counter() - start)
+            median = statistics.median(timings)
+            baseline = baseline or median
+            self.stdout.write('{:>12}: {:7.2f} ms ({:.1f}x)'.format(name, median * 1000, baseline / median))
+        cache.clear()
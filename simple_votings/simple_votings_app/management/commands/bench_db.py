@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection
+from django.test import RequestFactory
+
+from simple_votings_app.benchmarks import bench_author, bench_voting, percentile
+from simple_votings_app.views import vote, voting
+
+
+class Command(BaseCommand):
+    help = 'Compares concurrent vote and voting page throughput of the database profiles (DB_PROFILE)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default='development,production')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--writes', type=float, default=0.3, help='Share of requests that are votes')
+        # Runs the benchmark in this process with its DB_PROFILE, used by the parent
+        parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.stdout.write(json.dumps(self.run(options['threads'], options['duration'], options['writes'])))
+            return
+
+        self.stdout.write('{:<14}{:>9}{:>9}{:>12}{:>12}{:>12}{:>12}{:>9}'.format(
+            'profile', 'requests', 'req/s', 'read p50', 'read p99', 'vote p50', 'vote p99', 'errors'
+        ))
+        for profile in options['profiles'].split(','):
+            # Every profile is measured in a process of its own, with its real settings
+            child = subprocess.run(
+                [sys.executable, sys.argv[0], 'bench_db', '--child',
+                 '--threads', str(options['threads']),
+                 '--duration', str(options['duration']),
+                 '--writes', str(options['writes'])],
+                env=dict(os.environ, DB_PROFILE=profile),
+                stdout=subprocess.PIPE, text=True,
+            )
+            if child.returncode:
+                raise CommandError('Benchmark of {} failed'.format(profile))
+            result = json.loads(child.stdout.splitlines()[-1])
+            self.stdout.write('{:<14}{:>9}{:>9.0f}{:>12.1f}{:>12.1f}{:>12.1f}{:>12.1f}{:>9}'.format(
+                profile, result['requests'], result['requests'] / result['duration'],
+                result['read_p50'], result['read_p99'], result['vote_p50'], result['vote_p99'], result['errors']
+            ))
+
+    def run(self, threads, duration, writes):
+        if connection.vendor == 'sqlite' and 'journal_mode' not in settings.SQLITE_PRAGMAS:
+            # WAL is stored in the database file, go back to the default journal
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode = delete')
+
+        benched, answers = bench_voting(bench_author(), is_multiple=True)
+        connection.close()
+
+        factory = RequestFactory()
+        counter = iter(range(1 << 24))
+        deadline = time.perf_counter() + duration
+        reads, votes, errors = [], [], []
+
+        def request(n):
+            if (n * 7919 % 1000) / 1000 < writes:
+                request = factory.post('/vote/', REMOTE_ADDR='10.{}.{}.{}'.format(n >> 16 & 255, n >> 8 & 255, n & 255))
+                request.user = AnonymousUser()
+                return votes, lambda: vote(request, answers[n % len(answers)].id)
+            request = factory.get('/voting/')
+            request.user = AnonymousUser()
+            return reads, lambda: voting(request, benched.id)
+
+        def work():
+            while time.perf_counter() < deadline:
+                timings, view = request(next(counter))
+                # What Django does around every request, connections are
+                # closed unless CONN_MAX_AGE keeps them
+                close_old_connections()
+                start = time.perf_counter()
+                try:
+                    view()
+                    timings.append((time.perf_counter() - start) * 1000)
+                except OperationalError as e:
+                    errors.append(str(e))
+                close_old_connections()
+            connection.close()
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=work) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        benched.delete()
+        reads.sort()
+        votes.sort()
+        return {
+            'duration': elapsed,
+            'requests': len(reads) + len(votes) + len(errors),
+            'read_p50': percentile(reads, 50) if reads else 0,
+            'read_p99': percentile(reads, 99) if reads else 0,
+            'vote_p50': percentile(votes, 50) if votes else 0,
+            'vote_p99': percentile(votes, 99) if votes else 0,
+            'errors': len(errors),
+        }
@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from simple_votings_app.benchmarks import bench_author, bench_voting
+from simple_votings_app.vote_buffer import vote_buffer
+from simple_votings_app.views import vote
+
+
+class Command(BaseCommand):
+    help = 'Compares anonymous vote throughput of the synchronous and the buffered ingestion'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--votes', type=int, default=2000)
+        parser.add_argument('--threads', type=int, default=8)
+
+    def handle(self, *args, **options):
+        author = bench_author()
+
+        for buffered in (False, True):
+            voting, answers = bench_voting(author)
+            try:
+                with override_settings(VOTE_BUFFER=buffered):
+                    elapsed, statuses = self.run_votes(answers, options['votes'], options['threads'])
+                    start = time.perf_counter()
+                    vote_buffer.stop()
+                    drained = time.perf_counter() - start
+                voting.refresh_from_db()
+                self.stdout.write(
+                    '{}: {} requests in {:.2f}s ({:.0f} req/s), queue drained in {:.2f}s, '
+                    'stored votes {}, statuses {}'.format(
+                        'buffered' if buffered else 'synchronous',
+                        options['votes'], elapsed, options['votes'] / elapsed, drained,
+                        voting.votes_total, statuses
+                    )
+                )
+            finally:
+                voting.delete()
+
+    def run_votes(self, answers, count, threads):
+        factory = RequestFactory()
+
+        def cast(i):
+            request = factory.post('/vote/', REMOTE_ADDR='10.{}.{}.{}'.format(i >> 16 & 255, i >> 8 & 255, i & 255))
+            request.user = AnonymousUser()
+            try:
+                return vote(request, answers[i % len(answers)].id).status_code
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            statuses = list(executor.map(cast, range(count)))
+        elapsed = time.perf_counter() - start
+        return elapsed, {status: statuses.count(status) for status in set(statuses)}
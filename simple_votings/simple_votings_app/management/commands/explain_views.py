@@ -0,0 +1,92 @@
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+
+from simple_votings_app.models import Voting
+
+# "SCAN table" without an index is a full table scan, "SCAN table USING
+# (COVERING) INDEX" and "SEARCH table USING ..." are fine
+FULL_SCAN = re.compile(r'^SCAN (simple_votings_app_\w+)\b(?! USING)')
+
+
+class Command(BaseCommand):
+    help = 'Prints EXPLAIN QUERY PLAN for every query of the main views and reports full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strict', action='store_true', help='Fail if a full table scan is found')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN is only available on SQLite')
+
+        voting = Voting.objects.filter(is_deleted=False).order_by('-votes_total').first()
+        if voting is None:
+            raise CommandError('Create at least one voting first')
+        answer = voting.answers().first()
+
+        requests = [
+            ('get', '/'),
+            ('get', '/voting/{}/'.format(voting.id)),
+            ('get', '/profile/{}/'.format(voting.user_id)),
+            ('get', '/reports/'),
+            ('get', '/create/'),
+            ('get', '/voting/{}/edit/'.format(voting.id)),
+            ('post', '/like/{}/'.format(voting.id)),
+        ]
+        if answer is not None:
+            requests.append(('post', '/vote/{}/'.format(answer.id)))
+
+        full_scans = []
+        # Views that did not run, their plans would prove nothing
+        failed = []
+        for method, path in requests:
+            queries = []
+
+            def capture(execute, sql, params, many, context):
+                queries.append((sql, params))
+                return execute(sql, params, many, context)
+
+            # Nothing done by the views is kept, not even the user: a new
+            # superuser sees the reports, edits any voting and has not voted.
+            # Buffered votes would be written outside of the transaction.
+            with transaction.atomic(), override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], VOTE_BUFFER=False
+            ):
+                client = Client()
+                client.force_login(User.objects.create_superuser('explain_views', password=None))
+                with connection.execute_wrapper(capture):
+                    status = getattr(client, method)(path).status_code
+                transaction.set_rollback(True)
+            if status >= 400 or not queries:
+                failed.append('{} {} ({}, {} queries)'.format(method.upper(), path, status, len(queries)))
+
+            self.stdout.write(self.style.MIGRATE_HEADING('{} {} ({}, {} queries)'.format(
+                method.upper(), path, status, len(queries)
+            )))
+            for sql, params in queries:
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                self.stdout.write('  ' + sql)
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                    for row in cursor.fetchall():
+                        detail = row[-1]
+                        if FULL_SCAN.match(detail):
+                            full_scans.append((path, detail))
+                            self.stdout.write(self.style.WARNING('    ' + detail))
+                        else:
+                            self.stdout.write('    ' + detail)
+
+        if failed:
+            raise CommandError('Views failed: ' + ', '.join(failed))
+        if full_scans:
+            self.stdout.write(self.style.WARNING('{} full table scans found'.format(len(full_scans))))
+            if options['strict']:
+                raise CommandError('Full table scans: ' + ', '.join(path for path, _ in full_scans))
+        else:
+            self.stdout.write(self.style.SUCCESS('No full table scans'))
@@ -0,0 +1,322 @@
+import bisect
+import datetime
+import itertools
+import random
+import time
+from array import array
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from simple_votings_app.counters import rebuild_voting_counters, rebuild_profile_stats
+from simple_votings_app.counters import rebuild_hot_scores, rebuild_vote_rollups
+from simple_votings_app.models import Vote, VotingAnswer, Voting
+from simple_votings_app.models import Like, Comment, Profile, Report
+
+STOPWORDS = (
+    'и', 'в', 'не', 'на', 'что', 'с', 'а', 'как', 'это', 'по', 'но', 'из', 'у', 'за', 'от', 'так',
+    'все', 'же', 'для', 'или', 'вы', 'мы', 'он', 'она', 'какой', 'ваш', 'самый', 'лучше', 'ли', 'бы',
+)
+WORDS = (
+    'лучший', 'город', 'фильм', 'язык', 'программирования', 'игра', 'года', 'музыка', 'кофе',
+    'чай', 'отпуск', 'спорт', 'книга', 'сериал', 'погода', 'телефон', 'еда', 'команда', 'школа',
+)
+SYLLABLES = ('ка', 'ро', 'ли', 'на', 'то', 'ве', 'ми', 'за', 'до', 'пе', 'ры', 'сту', 'гра', 'бо', 'ле', 'ни')
+
+
+def vocabulary():
+    """Stopwords, then the topic words, then thousands of made up ones, most frequent first."""
+    made_up = [''.join(syllables) for size in (2, 3) for syllables in itertools.product(SYLLABLES, repeat=size)]
+    random.Random(0).shuffle(made_up)
+    return STOPWORDS + WORDS + tuple(made_up)
+
+
+# Answers are chosen with these weights, the first ones are more popular
+ANSWER_WEIGHTS = tuple(itertools.accumulate((8, 5, 3, 2, 1, 1)))
+
+# Users of a voting are taken with this stride through the generated users
+# so that nobody votes or likes twice, it must be coprime with their number
+STRIDES = (7919, 7907, 7901, 7883, 7879)
+
+
+def zipf_weights(count, skew):
+    """Cumulative weights of ranks 1..count, rank r is picked with probability ~ 1 / r ** skew."""
+    total = 0.0
+    weights = array('d')
+    for rank in range(1, count + 1):
+        total += 1 / rank ** skew
+        weights.append(total)
+    return weights
+
+
+def pick(rng, cum_weights):
+    return bisect.bisect(cum_weights, rng.random() * cum_weights[-1])
+
+
+VOCABULARY = vocabulary()
+# Word frequencies of texts follow Zipf's law
+VOCABULARY_WEIGHTS = zipf_weights(len(VOCABULARY), 1.0)
+
+
+def sentence(rng, words):
+    return ' '.join(VOCABULARY[pick(rng, VOCABULARY_WEIGHTS)] for _ in range(words))
+
+
+def ip(n):
+    return '{}.{}.{}.{}'.format(n >> 24 & 255, n >> 16 & 255, n >> 8 & 255, n & 255)
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with synthetic users, votings, votes, likes, comments and reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--votings', type=int, default=1000)
+        parser.add_argument('--votes', type=int, default=100000)
+        parser.add_argument('--likes', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--reports', type=int, default=100)
+        parser.add_argument('--anonymous', type=float, default=0.3,
+                            help='Share of votes cast by anonymous users (by IP)')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Zipf exponent of the popularity of votings, higher makes a few polls viral')
+        parser.add_argument('--days', type=float, default=30,
+                            help='Votings are created over this many days up to now, activity follows them')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['votings'] < 1:
+            raise CommandError('At least one user and one voting are needed')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+        self.now = timezone.now()
+        since = self.now - datetime.timedelta(days=options['days'])
+
+        self.users = self.create_users(options['users'])
+        self.stride = next((s for s in STRIDES if len(self.users) % s), 1)
+        self.votings, self.multiple = self.create_votings(options['votings'])
+        self.start_times = self.spread_start_times(since)
+        self.answers, self.answer_offsets = self.create_answers()
+
+        popularity = zipf_weights(len(self.votings), options['skew'])
+        # Votings by popularity rank, the popular ones are not all the oldest
+        self.ranked = array('q', range(len(self.votings)))
+        self.rng.shuffle(self.ranked)
+        self.create_votes(options['votes'], options['anonymous'], popularity)
+        self.create_likes(options['likes'], popularity)
+        self.create_comments(options['comments'], popularity)
+        self.create_reports(options['reports'])
+
+        self.stdout.write('Rebuilding counters')
+        votings = Voting.objects.filter(id__gte=self.votings[0])
+        rebuild_voting_counters(votings)
+        rebuild_profile_stats(User.objects.filter(id__gte=self.users[0]))
+        # The rows were inserted without signals
+        rebuild_hot_scores(since)
+        rebuild_vote_rollups()
+
+        self.stdout.write(self.style.SUCCESS('Done in {:.1f}s'.format(time.perf_counter() - started)))
+
+    def insert(self, model, rows):
+        """Saves objects generated lazily in batches, one transaction per batch, and returns their ids."""
+        ids = array('q')
+        with self.timed(model) as saved:
+            rows = iter(rows)
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    model.objects.bulk_create(batch, batch_size=self.batch_size)
+                saved.append(len(batch))
+                ids.extend(row.pk for row in batch if row.pk is not None)
+        return ids
+
+    def insert_values(self, model, fields, rows, **constants):
+        """
+        Same as insert for tables nobody needs the ids of, rows are tuples of
+        the fields values. Building model instances and an INSERT per hundred
+        rows costs much more than the database work, so the batches are sent
+        with a single executemany instead of bulk_create.
+        """
+        fields = [model._meta.get_field(name) for name in fields]
+        constants = {
+            model._meta.get_field(name): value
+            for name, value in constants.items()
+        }
+        # auto_now dates that rows do not give are filled in as by bulk_create
+        for field in model._meta.concrete_fields:
+            if field not in fields and (getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)):
+                constants.setdefault(field, timezone.now())
+        constant_values = tuple(
+            field.get_db_prep_save(value, connection)
+            for field, value in constants.items()
+        )
+        columns = [field.column for field in fields + list(constants)]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(column) for column in columns),
+            ', '.join(['%s'] * len(columns)),
+        )
+
+        with self.timed(model) as saved:
+            rows = iter(rows)
+            while True:
+                batch = [row + constant_values for row in itertools.islice(rows, self.batch_size)]
+                if not batch:
+                    break
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.executemany(sql, batch)
+                saved.append(len(batch))
+
+    @contextmanager
+    def timed(self, model):
+        saved = []
+        start = time.perf_counter()
+        yield saved
+        elapsed = time.perf_counter() - start
+        self.stdout.write('{}: {} rows in {:.1f}s ({:.0f} rows/s)'.format(
+            model.__name__, sum(saved), elapsed, sum(saved) / elapsed if elapsed else 0
+        ))
+
+    def create_users(self, count):
+        first = (User.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        now = timezone.now()
+        users = self.insert(User, (
+            User(username='user{}'.format(first + i), password='!', last_login=now)
+            for i in range(count)
+        ))
+        self.insert(Profile, (Profile(user_id=user_id) for user_id in users))
+        return users
+
+    def create_votings(self, count):
+        rng = self.rng
+        # Some users create most of the votings
+        authors = zipf_weights(len(self.users), 1.0)
+        multiple = array('b', (rng.random() < 0.2 for _ in range(count)))
+
+        votings = self.insert(Voting, (
+            Voting(
+                text=sentence(rng, rng.randint(3, 12)).capitalize() + '?',
+                user_id=self.users[pick(rng, authors)],
+                is_multiple=multiple[i],
+                is_anonymous_allowed=rng.random() < 0.5,
+            )
+            for i in range(count)
+        ))
+        return votings, multiple
+
+    def spread_start_times(self, since):
+        """Spreads the start times of the votings from since to now in the order of their ids, returns them."""
+        rng = self.rng
+        start_times = array('d', sorted(rng.uniform(since.timestamp(), self.now.timestamp()) for _ in self.votings))
+        # bulk_create overwrites auto_now fields with the current time
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                'UPDATE {} SET start_time = %s WHERE id = %s'.format(Voting._meta.db_table),
+                [(self.db_date(start_time), voting_id) for start_time, voting_id in zip(start_times, self.votings)]
+            )
+        return start_times
+
+    def activity_date(self, i):
+        """A random moment between the start of the i-th voting and now, most activity comes early."""
+        start = self.start_times[i]
+        return self.db_date(start + (self.now.timestamp() - start) * self.rng.random() ** 3)
+
+    def db_date(self, timestamp):
+        date = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+        return connection.ops.adapt_datetimefield_value(date)
+
+    def create_answers(self):
+        rng = self.rng
+        counts = [rng.randint(2, len(ANSWER_WEIGHTS)) for _ in self.votings]
+        offsets = array('q', [0])
+        for count in counts:
+            offsets.append(offsets[-1] + count)
+
+        answers = self.insert(VotingAnswer, (
+            VotingAnswer(text=sentence(rng, rng.randint(1, 4)), voting_id=voting_id)
+            for voting_id, count in zip(self.votings, counts)
+            for _ in range(count)
+        ))
+        return answers, offsets
+
+    def voters(self, count, popularity):
+        """
+        Yields (voting index, user id) pairs, a user id is None once every
+        generated user has been used for the voting.
+        """
+        rng = self.rng
+        taken = array('q', bytes(8 * len(self.votings)))
+        starts = array('q', (rng.randrange(len(self.users)) for _ in self.votings))
+        for _ in range(count):
+            i = self.ranked[pick(rng, popularity)]
+            if taken[i] < len(self.users):
+                yield i, self.users[(starts[i] + taken[i] * self.stride) % len(self.users)]
+                taken[i] += 1
+            else:
+                yield i, None
+
+    def create_votes(self, count, anonymous, popularity):
+        rng = self.rng
+        anonymous_ips = itertools.count(1 << 24)
+        registered = self.voters(count, popularity)
+
+        def votes():
+            for _ in range(count):
+                if rng.random() < anonymous:
+                    i, user_id = self.ranked[pick(rng, popularity)], None
+                else:
+                    i, user_id = next(registered)
+                first, last = self.answer_offsets[i], self.answer_offsets[i + 1]
+                answer = first + pick(rng, ANSWER_WEIGHTS[:last - first])
+                yield (
+                    self.answers[answer],
+                    self.votings[i],
+                    not self.multiple[i],
+                    user_id,
+                    '' if user_id else ip(next(anonymous_ips)),
+                    self.activity_date(i),
+                )
+
+        self.insert_values(Vote, ('answer', 'voting', 'is_single', 'user', 'user_ip', 'date'), votes())
+
+    def create_likes(self, count, popularity):
+        self.insert_values(Like, ('voting', 'user', 'date'), (
+            (self.votings[i], user_id, self.activity_date(i))
+            for i, user_id in self.voters(count, popularity)
+            if user_id is not None
+        ))
+
+    def create_comments(self, count, popularity):
+        rng = self.rng
+
+        def comments():
+            for _ in range(count):
+                i = self.ranked[pick(rng, popularity)]
+                yield (
+                    self.votings[i],
+                    rng.choice(self.users),
+                    sentence(rng, rng.randint(2, 30)).capitalize(),
+                    self.activity_date(i),
+                )
+
+        self.insert_values(Comment, ('voting', 'user', 'text', 'date'), comments())
+
+    def create_reports(self, count):
+        rng = self.rng
+        self.insert_values(Report, ('voting', 'user', 'message', 'closed'), (
+            (
+                rng.choice(self.votings),
+                rng.choice(self.users),
+                sentence(rng, rng.randint(3, 15)).capitalize(),
+                rng.random() < 0.3,
+            )
+            for _ in range(count)
+        ))
@@ -0,0 +1,343 @@
+import bisect
+import datetime
+import itertools
+import json
+import logging
+import random
+import socket
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db.models import Q
+from django.test.utils import override_settings
+
+from simple_votings_app.benchmarks import percentile
+from simple_votings_app.models import Vote, Voting, VotingAnswer
+
+PASSWORD = 'loadtest'
+
+KINDS = ('index', 'voting', 'vote_anonymous', 'vote', 'like')
+# Error statuses that are answers of the site rather than failures: 409 is a
+# repeated vote, of a registered user only once it has voted in every voting.
+# Only open votings are used, so a 403 is a CSRF failure.
+EXPECTED = {
+    'vote_anonymous': {409},
+    'vote': {409},
+}
+DEFAULT_MIX = 'index=30,voting=40,vote_anonymous=10,vote=10,like=10'
+
+
+def breakdown(statuses):
+    return ' '.join('{}:{}'.format(*item) for item in sorted(statuses.items()))
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(','):
+        kind, _, weight = item.partition('=')
+        if kind not in KINDS:
+            raise CommandError('Unknown request kind {}, expected one of {}'.format(kind, ', '.join(KINDS)))
+        weights[kind] = float(weight)
+    return weights
+
+
+class NoRedirect(HTTPRedirectHandler):
+    # vote and like answer with a redirect, following it would measure the voting page too
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Session:
+    """A browser with its own cookies, so its own session and CSRF token."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), NoRedirect)
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, method, path, data=None, ip=None):
+        headers = {}
+        body = None
+        if ip is not None:
+            headers['X-Forwarded-For'] = ip
+        if method == 'POST':
+            headers['X-CSRFToken'] = self.csrf_token()
+            body = urlencode(data or {}).encode()
+
+        try:
+            with self.opener.open(Request(self.base_url + path, body, headers, method=method), timeout=30) as response:
+                response.read()
+                return response.status
+        except HTTPError as e:
+            e.read()
+            return e.code
+
+    def start(self):
+        # Sets the CSRF cookie
+        self.request('GET', '/login/')
+
+    def login(self, username):
+        self.start()
+        status = self.request('POST', '/login/', {
+            'username': username,
+            'password': PASSWORD,
+            'csrfmiddlewaretoken': self.csrf_token(),
+        })
+        if status != 302:
+            raise CommandError('Could not log in as {} (status {})'.format(username, status))
+
+
+class Command(BaseCommand):
+    help = 'Sends mixed browse, vote and like traffic to the site and reports latency percentiles per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Site to load, e.g. http://127.0.0.1:8000 of runserver')
+        parser.add_argument('--serve', choices=('wsgi', 'asgi'), default='wsgi',
+                            help='Without --url serve simple_votings/wsgi.py or asgi.py (needs uvicorn) in this process')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+        parser.add_argument('--requests', type=int, default=None, help='Stop after this many requests instead')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='Weights of the kinds of requests')
+        parser.add_argument('--votings', type=int, default=1000,
+                            help='Number of the most voted votings to send traffic to')
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of the popularity of votings')
+        parser.add_argument('--json', help='Also write the report to this file')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.mix = parse_mix(options['mix'])
+        self.kinds = list(self.mix)
+        self.kind_weights = list(itertools.accumulate(self.mix.values()))
+
+        self.votings = list(
+            Voting.objects.filter(Q(end_time__isnull=True) | Q(end_time__gt=datetime.date.today()), is_deleted=False)
+            .order_by('-votes_total').values_list('id', flat=True)[:options['votings']]
+        )
+        if not self.votings:
+            raise CommandError('There are no votings, run generate_data first')
+        self.answers = defaultdict(list)
+        for voting_id, answer_id in VotingAnswer.objects.filter(voting__in=self.votings).values_list('voting', 'id'):
+            self.answers[voting_id].append(answer_id)
+        self.popularity = list(itertools.accumulate(1 / rank ** options['skew'] for rank in range(1, len(self.votings) + 1)))
+
+        users = self.ensure_users(options['concurrency'])
+        # Votings every user has voted in, also in earlier runs
+        voted = {username: set() for username in users}
+        for username, voting_id in Vote.objects.filter(
+            user__username__in=users, voting__in=self.votings
+        ).values_list('user__username', 'voting').distinct():
+            voted[username].add(voting_id)
+        # Somewhere in 100.64.0.0/10 which generate_data does not use, so
+        # that anonymous votes of repeated runs rarely collide
+        self.anonymous_ips = itertools.count(100 << 24 | 64 << 16 | random.getrandbits(21))
+
+        with self.server(options) as base_url:
+            self.stdout.write('Logging in {} users at {}'.format(len(users), base_url))
+            sessions = []
+            for i, username in enumerate(users):
+                anonymous, registered = Session(base_url), Session(base_url)
+                anonymous.start()
+                registered.login(username)
+                sessions.append((anonymous, registered, voted[username], random.Random(
+                    None if options['seed'] is None else options['seed'] + i
+                )))
+
+            self.stdout.write('Running {} workers'.format(len(sessions)))
+            results = [defaultdict(list) for _ in sessions]
+            self.left = itertools.count() if options['requests'] is None else iter(range(options['requests']))
+            self.deadline = time.perf_counter() + options['duration'] if options['requests'] is None else None
+
+            start = time.perf_counter()
+            threads = [
+                threading.Thread(target=self.work, args=(*session, result))
+                for session, result in zip(sessions, results)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+        merged = defaultdict(list)
+        for result in results:
+            for kind, samples in result.items():
+                merged[kind].extend(samples)
+        report = self.report(merged, elapsed)
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def ensure_users(self, count):
+        usernames = ['loadtest{}'.format(i) for i in range(count)]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        password = make_password(PASSWORD)
+        for username in usernames:
+            if username not in existing:
+                # save() so that the profile is created
+                User(username=username, password=password).save()
+        return usernames
+
+    @contextmanager
+    def server(self, options):
+        if options['url']:
+            yield options['url'].rstrip('/')
+            return
+
+        with self.local_server(options['serve']) as base_url:
+            # Every 409 of a repeated vote would be logged as a warning, the
+            # level is set after the application has configured logging
+            logger = logging.getLogger('django.request')
+            level = logger.level
+            logger.setLevel(logging.ERROR)
+            try:
+                yield base_url
+            finally:
+                logger.setLevel(level)
+
+    @contextmanager
+    def local_server(self, serve):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+
+        if serve == 'wsgi':
+            from simple_votings.wsgi import application
+
+            httpd = ThreadedWSGIServer(('127.0.0.1', port), QuietHandler)
+            httpd.set_app(application)
+            thread = threading.Thread(target=httpd.serve_forever)
+            thread.start()
+            try:
+                yield 'http://127.0.0.1:{}'.format(port)
+            finally:
+                httpd.shutdown()
+                httpd.server_close()
+                thread.join()
+            return
+
+        try:
+            import uvicorn
+        except ImportError:
+            raise CommandError('Serving ASGI needs uvicorn: pip3 install uvicorn')
+
+        # asgi.py selects its urlconf through the environment, but settings are already loaded here
+        with override_settings(ROOT_URLCONF='simple_votings.asgi_urls'):
+            server = uvicorn.Server(uvicorn.Config(
+                'simple_votings.asgi:application', host='127.0.0.1', port=port, log_level='warning'
+            ))
+            thread = threading.Thread(target=server.run)
+            thread.start()
+            while not server.started:
+                if not thread.is_alive():
+                    raise CommandError('uvicorn did not start')
+                time.sleep(0.05)
+            try:
+                yield 'http://127.0.0.1:{}'.format(port)
+            finally:
+                server.should_exit = True
+                thread.join()
+
+    def pick_voting(self, rng):
+        return self.votings[bisect.bisect(self.popularity, rng.random() * self.popularity[-1])]
+
+    def unvoted_voting(self, voting_id, voted, rng):
+        # A repeated vote only measures the 409, a registered user votes where
+        # it has not yet: another popular voting, else the most voted one left
+        for _ in range(10):
+            if voting_id not in voted:
+                break
+            voting_id = self.pick_voting(rng)
+        else:
+            voting_id = next((item for item in self.votings if item not in voted), voting_id)
+        voted.add(voting_id)
+        return voting_id
+
+    def work(self, anonymous, registered, voted, rng, result):
+        while next(self.left, None) is not None:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                break
+
+            kind = self.kinds[bisect.bisect(self.kind_weights, rng.random() * self.kind_weights[-1])]
+            voting_id = self.pick_voting(rng)
+            if kind == 'vote':
+                voting_id = self.unvoted_voting(voting_id, voted, rng)
+            start = time.perf_counter()
+            try:
+                status = self.send(kind, voting_id, anonymous, registered, rng)
+            except (URLError, OSError):
+                status = None
+            result[kind].append((time.perf_counter() - start, status))
+
+    def send(self, kind, voting_id, anonymous, registered, rng):
+        if kind == 'index':
+            return anonymous.request('GET', '/')
+        if kind == 'voting':
+            return anonymous.request('GET', '/voting/{}/'.format(voting_id))
+        if kind == 'like':
+            return registered.request('POST', '/like/{}/'.format(voting_id))
+
+        answer_id = rng.choice(self.answers[voting_id])
+        if kind == 'vote':
+            return registered.request('POST', '/vote/{}/'.format(answer_id))
+        n = next(self.anonymous_ips)
+        ip = '{}.{}.{}.{}'.format(n >> 24 & 255, n >> 16 & 255, n >> 8 & 255, n & 255)
+        return anonymous.request('POST', '/vote/{}/'.format(answer_id), ip=ip)
+
+    def report(self, results, elapsed):
+        report = {'duration': elapsed, 'endpoints': {}}
+        self.stdout.write('{:<16}{:>9}{:>9}{:>9}{:>9}{:>9}{:>9}  statuses'.format(
+            'endpoint', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'
+        ))
+        for kind in KINDS + ('total',):
+            if kind == 'total':
+                samples = [(sample_kind, sample) for sample_kind, items in results.items() for sample in items]
+            else:
+                samples = [(kind, sample) for sample in results.get(kind, ())]
+            if not samples:
+                continue
+
+            timings = sorted(timing * 1000 for _, (timing, _) in samples)
+            statuses = defaultdict(int)
+            errors = defaultdict(int)
+            for sample_kind, (_, status) in samples:
+                statuses[str(status)] += 1
+                if status is None or (status >= 400 and status not in EXPECTED.get(sample_kind, ())):
+                    errors[str(status)] += 1
+            row = {
+                'requests': len(samples),
+                'throughput': len(samples) / elapsed,
+                'p50': percentile(timings, 50),
+                'p95': percentile(timings, 95),
+                'p99': percentile(timings, 99),
+                'error_rate': sum(errors.values()) / len(samples),
+                'statuses': dict(statuses),
+                'errors': dict(errors),
+            }
+            report['endpoints'][kind] = row
+            self.stdout.write('{:<16}{:>9}{:>9.0f}{:>9.1f}{:>9.1f}{:>9.1f}{:>8.1%}  {}'.format(
+                kind, row['requests'], row['throughput'], row['p50'], row['p95'], row['p99'],
+                row['error_rate'], breakdown(statuses) + (' (errors {})'.format(breakdown(errors)) if errors else '')
+            ))
+        return report
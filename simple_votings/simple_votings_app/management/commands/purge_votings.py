@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from simple_votings_app.models import Voting
+from simple_votings_app.purge import purge_voting
+
+
+class Command(BaseCommand):
+    help = 'Purges soft deleted votings left over e.g. after a restart'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--pause', type=float, default=None)
+
+    def handle(self, *args, **options):
+        for voting_id in Voting.objects.filter(is_deleted=True).values_list('id', flat=True):
+            purge_voting(voting_id, options['chunk_size'], options['pause'], self.progress)
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def progress(self, voting_id, name, deleted):
+        self.stdout.write('Voting {}: {} {} deleted'.format(voting_id, deleted, name))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from simple_votings_app.counters import rebuild_voting_counters, rebuild_profile_stats
+from simple_votings_app.models import Voting
+
+
+class Command(BaseCommand):
+    help = 'Recalculates stored voting counters and profile statistics from the raw rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('voting_ids', nargs='*', type=int,
+                            help='Rebuild only these votings and their authors (everything by default)')
+
+    def handle(self, *args, **options):
+        votings = options['voting_ids'] or None
+        rebuild_voting_counters(votings)
+        self.stdout.write('Voting counters rebuilt')
+
+        users = None
+        if votings is not None:
+            users = Voting.objects.filter(id__in=votings).values('user')
+        rebuild_profile_stats(users)
+        self.stdout.write(self.style.SUCCESS('Profile statistics rebuilt'))
@@ -0,0 +1,19 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from simple_votings_app.counters import rebuild_hot_scores
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the hot scores of the votings active in the last days from their votes, likes and comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=7,
+                            help='Activity older than this has decayed to nothing and is not read')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - datetime.timedelta(days=options['days'])
+        updated = rebuild_hot_scores(since)
+        self.stdout.write(self.style.SUCCESS('Hot scores of {} votings rebuilt'.format(updated)))
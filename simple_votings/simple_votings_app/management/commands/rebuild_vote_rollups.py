@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from simple_votings_app.counters import rebuild_vote_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recounts the hourly vote rollups of every voting from its votes, a chunk of votings at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Votings per transaction')
+
+    def handle(self, *args, **options):
+        def progress(last_id, total):
+            self.stdout.write('Up to voting {}: {} rollups'.format(last_id, total))
+
+        total = rebuild_vote_rollups(options['chunk_size'], progress)
+        self.stdout.write(self.style.SUCCESS('{} rollups rebuilt'.format(total)))
@@ -0,0 +1,37 @@
+import sqlite3
+import time
+from contextlib import closing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Copies the default SQLite database into the replica files (SQLITE_REPLICAS), a stand-in for replication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep copying every so many seconds, the replication lag')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('Only SQLite databases are copied, replicate other databases with their own tools')
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured, set SQLITE_REPLICAS')
+
+        while True:
+            start = time.perf_counter()
+            for alias in settings.DATABASE_REPLICAS:
+                self.copy(settings.DATABASES['default']['NAME'], settings.DATABASES[alias]['NAME'])
+            self.stdout.write('Copied to {} replicas in {:.2f}s'.format(
+                len(settings.DATABASE_REPLICAS), time.perf_counter() - start
+            ))
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
+
+    def copy(self, source, target):
+        # The backup API gives a consistent snapshot while the site keeps writing
+        with closing(sqlite3.connect(source)) as src, closing(sqlite3.connect(target)) as dst:
+            src.backup(dst)
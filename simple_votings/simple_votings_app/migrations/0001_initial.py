@@ -0,0 +1,105 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('avatar', models.ImageField(blank=True, default='avatars/0.png', null=True, upload_to='avatars/')),
+                ('avatar_renditions', models.JSONField(blank=True, default=dict)),
+                ('job', models.CharField(max_length=100, null=True)),
+                ('biography', models.CharField(max_length=500, null=True)),
+                ('gender', models.CharField(choices=[('M', 'Мужчина'), ('F', 'Женщина'), (None, 'Не указано')], max_length=1, null=True)),
+                ('country', models.CharField(max_length=60, null=True)),
+                ('birth', models.DateField(null=True)),
+                ('show_email', models.BooleanField(default=False)),
+                ('votings_total', models.PositiveIntegerField(default=0)),
+                ('votes_total', models.PositiveIntegerField(default=0)),
+                ('likes_total', models.PositiveIntegerField(default=0)),
+                ('comments_total', models.PositiveIntegerField(default=0)),
+                ('likes_on_votings_total', models.PositiveIntegerField(default=0)),
+                ('votes_on_votings_total', models.PositiveIntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Voting',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.CharField(max_length=500)),
+                ('start_time', models.DateTimeField(auto_now=True)),
+                ('end_time', models.DateField(default=None, null=True)),
+                ('is_multiple', models.BooleanField(default=False)),
+                ('is_anonymous_allowed', models.BooleanField(default=False)),
+                ('likes_total', models.PositiveIntegerField(default=0)),
+                ('comments_total', models.PositiveIntegerField(default=0)),
+                ('votes_total', models.PositiveIntegerField(default=0)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(default='anonymous', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Report',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('closed', models.BooleanField(default=False)),
+                ('message', models.CharField(max_length=500)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('voting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='simple_votings_app.voting')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Like',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('voting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='simple_votings_app.voting')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Comment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(auto_now=True)),
+                ('text', models.CharField(max_length=500)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('voting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='simple_votings_app.voting')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VotingAnswer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.CharField(max_length=500)),
+                ('votes_total', models.PositiveIntegerField(default=0)),
+                ('voting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='simple_votings_app.voting')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Vote',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(auto_now=True)),
+                ('user_ip', models.CharField(default='', max_length=16)),
+                ('is_single', models.BooleanField(default=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('voting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='simple_votings_app.voting')),
+                ('answer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='simple_votings_app.votinganswer')),
+            ],
+        ),
+    ]
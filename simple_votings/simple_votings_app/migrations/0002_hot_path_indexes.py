@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_votings_app', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['voting', 'date', 'id'], name='simple_voti_voting__473ab0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(condition=models.Q(('closed', False)), fields=['voting'], name='open_report_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['voting', 'user'], name='simple_voti_voting__44f870_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['voting', 'user_ip'], name='simple_voti_voting__b59702_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['answer', 'user_ip'], name='simple_voti_answer__dfd1d4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voting',
+            index=models.Index(fields=['start_time', 'id'], name='simple_voti_start_t_588a28_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('voting', 'user'), name='unique_like'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_single', True)), fields=('voting', 'user'), name='unique_single_vote_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_single', True), ('user__isnull', True)), fields=('voting', 'user_ip'), name='unique_single_vote_ip'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('answer', 'user'), name='unique_answer_vote_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('answer', 'user_ip'), name='unique_answer_vote_ip'),
+        ),
+    ]
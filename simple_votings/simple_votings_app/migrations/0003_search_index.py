@@ -0,0 +1,80 @@
+from django.db import migrations
+
+# Full-text indexes of the texts of votings, answers and comments, used by
+# simple_votings_app.search. SQLite gets FTS5 tables over the model tables
+# kept in sync by triggers, PostgreSQL GIN indexes on their tsvectors.
+
+SEARCHED_TABLES = (
+    'simple_votings_app_voting',
+    'simple_votings_app_votinganswer',
+    'simple_votings_app_comment',
+)
+
+# Migrations that make SQLite copy one of these tables (e.g. adding a NOT
+# NULL column) drop its triggers and have to create them again
+SQLITE_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+        INSERT INTO {table}_fts (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+        INSERT INTO {table}_fts ({table}_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF text ON {table} BEGIN
+        INSERT INTO {table}_fts ({table}_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO {table}_fts (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+)
+
+SQLITE_CREATE = (
+    """
+    CREATE VIRTUAL TABLE {table}_fts USING fts5(
+        text, content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    *SQLITE_TRIGGERS,
+    # Index the existing rows
+    "INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')",
+)
+
+SQLITE_DROP = (
+    'DROP TRIGGER {table}_fts_insert',
+    'DROP TRIGGER {table}_fts_delete',
+    'DROP TRIGGER {table}_fts_update',
+    'DROP TABLE {table}_fts',
+)
+
+POSTGRESQL_CREATE = (
+    "CREATE INDEX {table}_fts ON {table} USING gin (to_tsvector('russian', text))",
+)
+
+POSTGRESQL_DROP = (
+    'DROP INDEX {table}_fts',
+)
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for table in SEARCHED_TABLES:
+            for statement in statements.get(schema_editor.connection.vendor, ()):
+                schema_editor.execute(statement.format(table=table))
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_votings_app', '0002_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_CREATE, 'postgresql': POSTGRESQL_CREATE}),
+            run({'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}),
+        ),
+    ]
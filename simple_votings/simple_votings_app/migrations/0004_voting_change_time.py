@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_votings_app', '0003_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='change_time',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:12
+
+import importlib
+
+import simple_votings_app.hot
+from django.db import migrations, models
+
+
+def score_creation(apps, schema_editor):
+    # Existing votings start from their creation, rebuild_hot_scores adds
+    # their recent activity
+    Voting = apps.get_model('simple_votings_app', 'Voting')
+    scores = [
+        (simple_votings_app.hot.hot_time(start_time), voting_id)
+        for voting_id, start_time in Voting.objects.values_list('id', 'start_time')
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany('UPDATE {} SET hot_score = %s WHERE id = %s'.format(Voting._meta.db_table), scores)
+
+
+def restore_search_triggers(apps, schema_editor):
+    # SQLite adds the column by copying the table, which drops the full-text
+    # index triggers of 0003_search_index with the old table
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search_index = importlib.import_module('simple_votings_app.migrations.0003_search_index')
+    for statement in search_index.SQLITE_TRIGGERS:
+        schema_editor.execute(statement.format(table='simple_votings_app_voting'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_votings_app', '0004_voting_change_time'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='voting',
+            name='hot_score',
+            field=models.FloatField(default=0.0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(score_creation, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='voting',
+            name='hot_score',
+            field=models.FloatField(default=simple_votings_app.hot.hot_time),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='voting',
+            index=models.Index(fields=['hot_score', 'id'], name='simple_voti_hot_sco_a56d11_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_votings_app', '0005_voting_hot_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('votes', models.IntegerField(default=0)),
+                ('answer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='simple_votings_app.votinganswer')),
+                ('voting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='simple_votings_app.voting')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['voting', 'hour'], name='simple_voti_voting__ea49e1_idx')],
+                'constraints': [models.UniqueConstraint(fields=('answer', 'hour'), name='unique_vote_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_votings_app', '0006_vote_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['user', 'date', 'id'], name='simple_voti_user_id_35df2d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['user', 'date', 'id'], name='simple_voti_user_id_49e44a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['user', 'date', 'id'], name='simple_voti_user_id_ee6e88_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voting',
+            index=models.Index(fields=['user', 'start_time', 'id'], name='simple_voti_user_id_30524f_idx'),
+        ),
+    ]
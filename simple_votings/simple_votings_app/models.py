@@ -1,11 +1,19 @@
 # -*- coding: utf-8 -*-
 import datetime
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import Now, TruncHour
 from django.contrib import admin
-from django.db.models.signals import post_save
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+from . import hot
+from .hot import hot_time, hot_increment
+
 
 class Voting(models.Model):
     text = models.CharField(max_length=500)
@@ -14,8 +22,28 @@ class Voting(models.Model):
     is_multiple = models.BooleanField(default=False)
     is_anonymous_allowed = models.BooleanField(default=False)
 
+    likes_total = models.PositiveIntegerField(default=0)
+    comments_total = models.PositiveIntegerField(default=0)
+    votes_total = models.PositiveIntegerField(default=0)
+    # Bumped on every change of the results, used in cache keys
+    version = models.PositiveIntegerField(default=0)
+    # When the version was last bumped, null if never
+    change_time = models.DateTimeField(null=True, default=None)
+    # Deleted votings are hidden at once and purged in the background
+    is_deleted = models.BooleanField(default=False)
+    # Grows with every vote, like and comment, see hot.py
+    hot_score = models.FloatField(default=hot_time)
+
     user = models.ForeignKey(to=User, on_delete=models.CASCADE, default="anonymous")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_time', 'id']),
+            models.Index(fields=['hot_score', 'id']),
+            # Profile lists, newest first
+            models.Index(fields=['user', 'start_time', 'id']),
+        ]
+
     def __str__(self):
         return "%s" % (self.text)
 
@@ -32,7 +60,7 @@ class Voting(models.Model):
         return Like.objects.filter(voting=self)
 
     def likes_count(self):
-        return len(self.likes())
+        return self.likes_total
 
     def comments(self):
         return Comment.objects.filter(voting=self)
@@ -43,10 +71,10 @@ class Voting(models.Model):
         return datetime.date.today() >= self.end_time
 
     def comments_count(self):
-        return len(self.comments())
+        return self.comments_total
 
     def votes_count(self):
-        return sum([i.votes_count() for i in self.answers()])
+        return self.votes_total
 
     def type(self):
         if self.is_multiple and self.end_time:
@@ -67,9 +95,18 @@ class Like(models.Model):
     voting = models.ForeignKey(to=Voting, on_delete=models.CASCADE)
     user = models.ForeignKey(to=User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date', 'id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['voting', 'user'], name='unique_like'),
+        ]
+
 
 class VotingAnswer(models.Model):
     text = models.CharField(max_length=500)
+    votes_total = models.PositiveIntegerField(default=0)
 
     voting = models.ForeignKey(to=Voting, on_delete=models.CASCADE)
 
@@ -83,7 +120,7 @@ class VotingAnswer(models.Model):
         return Vote.objects.filter(answer=self)
 
     def votes_count(self):
-        return len(self.votes())
+        return self.votes_total
 
 
 class Vote(models.Model):
@@ -93,6 +130,69 @@ class Vote(models.Model):
     user = models.ForeignKey(to=User, on_delete=models.CASCADE, blank=True, null=True)
     user_ip = models.CharField(max_length=16, default="")
 
+    # Copied from the answer so that single choice votes can be made unique per voting
+    voting = models.ForeignKey(to=Voting, on_delete=models.CASCADE)
+    is_single = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['voting', 'user']),
+            models.Index(fields=['voting', 'user_ip']),
+            # (answer, user) is covered by unique_answer_vote_user
+            models.Index(fields=['answer', 'user_ip']),
+            models.Index(fields=['user', 'date', 'id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['voting', 'user'], condition=Q(is_single=True),
+                                    name='unique_single_vote_user'),
+            models.UniqueConstraint(fields=['voting', 'user_ip'], condition=Q(is_single=True, user__isnull=True),
+                                    name='unique_single_vote_ip'),
+            models.UniqueConstraint(fields=['answer', 'user'], name='unique_answer_vote_user'),
+            models.UniqueConstraint(fields=['answer', 'user_ip'], condition=Q(user__isnull=True),
+                                    name='unique_answer_vote_ip'),
+        ]
+
+
+class VoteRollup(models.Model):
+    """Votes for an answer cast in an hour, kept by the vote receivers for charts."""
+    answer = models.ForeignKey(to=VotingAnswer, on_delete=models.CASCADE)
+    # Copied from the answer so that a voting's timeline is one index range
+    voting = models.ForeignKey(to=Voting, on_delete=models.CASCADE)
+    hour = models.DateTimeField()
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['voting', 'hour']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['answer', 'hour'], name='unique_vote_rollup'),
+        ]
+
+
+# Rollup hours are UTC whatever TIME_ZONE is, the hours of a zone with a
+# half-hour offset would not match them
+def vote_hour(date):
+    return date.astimezone(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def vote_hour_expression(field):
+    """vote_hour of field in a query."""
+    return TruncHour(field, tzinfo=datetime.timezone.utc)
+
+
+def add_vote_rollups(counts):
+    """Adds counts {(answer_id, voting_id, hour): votes} to the rollups."""
+    # Creates the missing rollups in one statement, a concurrent vote may
+    # have created one first. Votes from before the rollups were built have
+    # none to subtract from.
+    VoteRollup.objects.bulk_create([
+        VoteRollup(answer_id=answer_id, voting_id=voting_id, hour=hour)
+        for (answer_id, voting_id, hour), votes in counts.items() if votes > 0
+    ], ignore_conflicts=True)
+    for (answer_id, voting_id, hour), votes in counts.items():
+        VoteRollup.objects.filter(answer=answer_id, hour=hour).update(votes=F('votes') + votes)
+
 
 class Comment(models.Model):
     date = models.DateTimeField(auto_now=True)
@@ -101,6 +201,12 @@ class Comment(models.Model):
     voting = models.ForeignKey(to=Voting, on_delete=models.CASCADE)
     user = models.ForeignKey(to=User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['voting', 'date', 'id']),
+            models.Index(fields=['user', 'date', 'id']),
+        ]
+
 
 class VotingAdmin(admin.ModelAdmin):
     list_display = ('text', 'user', 'start_time', 'end_time')
@@ -120,6 +226,8 @@ class Profile(models.Model):
     user = models.OneToOneField(to=User, on_delete=models.CASCADE)
 
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True, default='avatars/0.png')
+    # Resized copies of the avatar by size, filled in by avatars.process_avatar
+    avatar_renditions = models.JSONField(default=dict, blank=True)
 
     job = models.CharField(null=True, max_length=100)
     biography = models.CharField(max_length=500, null=True)
@@ -129,6 +237,25 @@ class Profile(models.Model):
     birth = models.DateField(null=True)
     show_email = models.BooleanField(default=False)
 
+    votings_total = models.PositiveIntegerField(default=0)
+    votes_total = models.PositiveIntegerField(default=0)
+    likes_total = models.PositiveIntegerField(default=0)
+    comments_total = models.PositiveIntegerField(default=0)
+    likes_on_votings_total = models.PositiveIntegerField(default=0)
+    votes_on_votings_total = models.PositiveIntegerField(default=0)
+
+    def avatar_url(self, size=200):
+        name = self.avatar_renditions.get(str(size))
+        if name is None:
+            return self.avatar.url
+        return default_storage.url(name)
+
+    def small_avatar_url(self):
+        return self.avatar_url(64)
+
+    def tiny_avatar_url(self):
+        return self.avatar_url(32)
+
     def good_date(self, date):
         return '{}.{}.{} {}:{}'.format(date.day, date.month, date.year, date.hour, date.minute)
 
@@ -139,41 +266,34 @@ class Profile(models.Model):
         return self.good_date(self.user.last_login)
 
     def votings(self):
-        return Voting.objects.filter(user=self.user)
+        return Voting.objects.filter(user=self.user_id, is_deleted=False)
 
     def votings_count(self):
-        return len(self.votings())
+        return self.votings_total
 
     def likes_on_votings(self):
-        count = 0
-        for i in self.votings():
-            count += i.likes_count()
-        return count
+        return self.likes_on_votings_total
 
     def votes_on_votings(self):
-        count = 0
-        for voting in self.votings():
-            for answer in voting.answers():
-                count += answer.votes_count()
-        return count
+        return self.votes_on_votings_total
 
     def comments(self):
-        return Comment.objects.filter(user=self.user)
+        return Comment.objects.filter(user=self.user_id, voting__is_deleted=False).select_related('voting')
 
     def comments_count(self):
-        return len(self.comments())
+        return self.comments_total
 
     def votes(self):
-        return Vote.objects.filter(user=self.user)
+        return Vote.objects.filter(user=self.user_id, voting__is_deleted=False).select_related('answer__voting')
 
     def votes_count(self):
-        return len(self.votes())
+        return self.votes_total
 
     def likes(self):
-        return Like.objects.filter(user=self.user)
+        return Like.objects.filter(user=self.user_id, voting__is_deleted=False).select_related('voting')
 
     def likes_count(self):
-        return len(self.likes())
+        return self.likes_total
 
 
 class Report(models.Model):
@@ -183,6 +303,13 @@ class Report(models.Model):
 
     message = models.CharField(max_length=500)
 
+    class Meta:
+        indexes = [
+            # Only open reports are listed, SQLite can not use an index on
+            # the boolean itself for "NOT closed"
+            models.Index(fields=['voting'], condition=Q(closed=False), name='open_report_idx'),
+        ]
+
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -190,9 +317,118 @@ def create_user_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 
+# Profile fields saved along with the user, the counters are kept with F()
+# and the loaded profile would write them back stale
+USER_PROFILE_FIELDS = ('job', 'biography', 'gender', 'country', 'birth', 'show_email')
+
+
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+    # Only a profile loaded with the user may have changed, e.g. by the admin;
+    # a login saves last_login and has none
+    if sender.profile.is_cached(instance):
+        instance.profile.save(update_fields=USER_PROFILE_FIELDS)
+
+
+def new_version():
+    # Fields to update along with a change of the results of a voting
+    return {'version': F('version') + 1, 'change_time': Now()}
+
+
+def activity(weight, delta):
+    # New votes, likes and comments heat a voting up, taking them back does not cool it
+    return {'hot_score': hot_increment(weight * delta)} if delta > 0 else {}
+
+
+@receiver(post_save, sender=Vote)
+def count_created_vote(sender, instance, created, **kwargs):
+    if created:
+        change_votes_total(instance, 1)
+
+
+@receiver(post_delete, sender=Vote)
+def count_deleted_vote(sender, instance, **kwargs):
+    change_votes_total(instance, -1)
+
+
+def change_votes_total(vote, delta):
+    add_vote_rollups({(vote.answer_id, vote.voting_id, vote_hour(vote.date)): delta})
+    VotingAnswer.objects.filter(id=vote.answer_id).update(votes_total=F('votes_total') + delta)
+    Voting.objects.filter(id=vote.voting_id).update(
+        votes_total=F('votes_total') + delta,
+        **new_version(),
+        **activity(hot.VOTE, delta)
+    )
+    if vote.user_id is not None:
+        Profile.objects.filter(user=vote.user_id).update(votes_total=F('votes_total') + delta)
+    Profile.objects.filter(user__voting=vote.voting_id).update(
+        votes_on_votings_total=F('votes_on_votings_total') + delta
+    )
+
+
+@receiver(post_save, sender=Like)
+def count_created_like(sender, instance, created, **kwargs):
+    if created:
+        change_likes_total(instance, 1)
+
+
+@receiver(post_delete, sender=Like)
+def count_deleted_like(sender, instance, **kwargs):
+    change_likes_total(instance, -1)
+
+
+def change_likes_total(like, delta):
+    Voting.objects.filter(id=like.voting_id).update(
+        likes_total=F('likes_total') + delta,
+        **new_version(),
+        **activity(hot.LIKE, delta)
+    )
+    Profile.objects.filter(user=like.user_id).update(likes_total=F('likes_total') + delta)
+    Profile.objects.filter(user__voting=like.voting_id).update(
+        likes_on_votings_total=F('likes_on_votings_total') + delta
+    )
+
+
+@receiver(post_save, sender=Comment)
+def count_created_comment(sender, instance, created, **kwargs):
+    if created:
+        change_comments_total(instance, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_comments_total(instance, -1)
+
+
+def change_comments_total(comment, delta):
+    Voting.objects.filter(id=comment.voting_id).update(
+        comments_total=F('comments_total') + delta,
+        **new_version(),
+        **activity(hot.COMMENT, delta)
+    )
+    Profile.objects.filter(user=comment.user_id).update(comments_total=F('comments_total') + delta)
+
+
+@receiver(post_save, sender=Voting)
+def count_created_voting(sender, instance, created, **kwargs):
+    if created:
+        Profile.objects.filter(user=instance.user_id).update(votings_total=F('votings_total') + 1)
+
+
+@receiver(post_delete, sender=Voting)
+def count_deleted_voting(sender, instance, **kwargs):
+    # Soft deleted votings were not counted since they were hidden
+    if not instance.is_deleted:
+        Profile.objects.filter(user=instance.user_id).update(votings_total=F('votings_total') - 1)
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
 
 
 admin.site.register(Voting, VotingAdmin)
@@ -0,0 +1,59 @@
+import json
+import base64
+import binascii
+import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+PAGE_SIZE = 20
+
+
+def cursor_value(value):
+    # DjangoJSONEncoder cuts datetimes to milliseconds, the rows within the
+    # cut millisecond would be skipped
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def encode_cursor(item, fields):
+    values = [cursor_value(getattr(item, field)) for field in fields]
+    data = json.dumps(values, cls=DjangoJSONEncoder).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor, model, fields):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(fields):
+            return None
+        return [model._meta.get_field(field).to_python(value) for field, value in zip(fields, values)]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+
+
+def after_filter(fields, values):
+    # (a, b) < (x, y)  <=>  a < x or (a = x and b < y)
+    condition = Q()
+    for i, field in enumerate(fields):
+        step = Q(**{field + '__lt': values[i]})
+        for prev_field, prev_value in zip(fields[:i], values[:i]):
+            step &= Q(**{prev_field: prev_value})
+        condition |= step
+    return condition
+
+
+def keyset_page(queryset, fields, cursor=None, size=PAGE_SIZE):
+    """Returns (items, next_cursor) of the queryset ordered by fields descending."""
+    queryset = queryset.order_by(*['-' + field for field in fields])
+    if cursor:
+        values = decode_cursor(cursor, queryset.model, fields)
+        if values is not None:
+            queryset = queryset.filter(after_filter(fields, values))
+
+    items = list(queryset[:size + 1])
+    next_cursor = None
+    if len(items) > size:
+        items = items[:size]
+        next_cursor = encode_cursor(items[-1], fields)
+    return items, next_cursor
@@ -0,0 +1,72 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from .counters import delete_votes, delete_likes, delete_comments, raw_delete
+from .models import Vote, VotingAnswer, Voting
+from .models import Like, Comment, Profile, Report, VoteRollup
+from .models import new_version
+
+logger = logging.getLogger(__name__)
+
+# A single worker, purges run one after another
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='purge')
+
+
+def soft_delete_voting(voting):
+    with transaction.atomic():
+        if Voting.objects.filter(id=voting.id, is_deleted=False).update(is_deleted=True, **new_version()):
+            Profile.objects.filter(user=voting.user_id).update(votings_total=F('votings_total') - 1)
+        transaction.on_commit(lambda: schedule_purge(voting.id))
+
+
+def schedule_purge(voting_id):
+    return executor.submit(purge_in_background, voting_id)
+
+
+def purge_in_background(voting_id):
+    try:
+        purge_voting(voting_id)
+    except Exception:
+        logger.exception('Could not purge voting %s', voting_id)
+    finally:
+        connection.close()
+
+
+def log_progress(voting_id, name, deleted):
+    logger.info('Voting %s: %d %s deleted', voting_id, deleted, name)
+
+
+def purge_voting(voting_id, chunk_size=None, pause=None, progress=log_progress):
+    """Deletes a soft deleted voting with its children, chunk_size rows per transaction."""
+    chunk_size = chunk_size or settings.PURGE_CHUNK_SIZE
+    pause = settings.PURGE_PAUSE if pause is None else pause
+
+    steps = (
+        # First, deleting the votes then leaves them alone
+        ('rollups', VoteRollup, raw_delete),
+        ('votes', Vote, lambda votes: delete_votes(votes, rollups=False)),
+        ('likes', Like, delete_likes),
+        ('comments', Comment, delete_comments),
+        ('reports', Report, raw_delete),
+        ('answers', VotingAnswer, lambda answers: answers.delete()),
+    )
+    for name, model, delete in steps:
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                ids = list(model.objects.filter(voting=voting_id).values_list('id', flat=True)[:chunk_size])
+                if not ids:
+                    break
+                delete(model.objects.filter(id__in=ids))
+            deleted += len(ids)
+            progress(voting_id, name, deleted)
+            # Let other writers take the lock between chunks
+            time.sleep(pause)
+
+    Voting.objects.filter(id=voting_id, is_deleted=True).delete()
+    progress(voting_id, 'voting', 1)
@@ -0,0 +1,77 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+# Set for the requests that may read from a replica. Everything else
+# (writes, management commands, background threads) uses the default database
+replica_allowed = ContextVar('replica_allowed', default=False)
+
+STICKY_COOKIE = 'read_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or not replica_allowed.get():
+            return 'default'
+        # What is read in a transaction of the default database must be current
+        if connections['default'].in_atomic_block:
+            return 'default'
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get the schema from the default database
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaMiddleware:
+    """
+    Lets safe requests read from replicas. A client that has sent an unsafe
+    request reads from the default database for REPLICA_STICKY_SECONDS, so
+    that it sees its own vote, like or comment before the replicas catch up.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = replica_allowed.set(self.may_use_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_allowed.reset(token)
+        return self.stick(request, response)
+
+    async def __acall__(self, request):
+        token = replica_allowed.set(self.may_use_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_allowed.reset(token)
+        return self.stick(request, response)
+
+    def may_use_replica(self, request):
+        return request.method in SAFE_METHODS and STICKY_COOKIE not in request.COOKIES
+
+    def stick(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import VotingAnswer
+
+HITS_KEY = 'voting-results:hits'
+MISSES_KEY = 'voting-results:misses'
+
+
+def results_key(voting):
+    return 'voting-results:{}:{}'.format(voting.id, voting.version)
+
+
+def count(key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # The key is missing or was evicted
+        cache.add(key, 0, None)
+        cache.incr(key, delta)
+
+
+def answers_query(voting):
+    return voting.answers().order_by('id').values_list('id', 'text', 'votes_total')
+
+
+def build_voting_results(voting, answers):
+    return {
+        'id': voting.id,
+        'version': voting.version,
+        'likes': voting.likes_total,
+        'comments': voting.comments_total,
+        'votes': voting.votes_total,
+        'answers': [
+            {'id': answer_id, 'text': text, 'votes': votes}
+            for answer_id, text, votes in answers
+        ],
+    }
+
+
+def get_voting_results(voting):
+    """Results of the voting, cached until its version changes."""
+    key = results_key(voting)
+    results = cache.get(key)
+    if results is None:
+        count(MISSES_KEY)
+        results = build_voting_results(voting, answers_query(voting))
+        cache.set(key, results, settings.RESULTS_CACHE_TIMEOUT)
+    else:
+        count(HITS_KEY)
+    return results
+
+
+def get_many_voting_results(votings):
+    """Results of every voting in votings, with one cache round trip and one query for the missing ones."""
+    keys = {results_key(voting): voting for voting in votings}
+    cached = cache.get_many(keys)
+    missing = [voting for key, voting in keys.items() if key not in cached]
+
+    if len(missing) < len(keys):
+        count(HITS_KEY, len(keys) - len(missing))
+    if missing:
+        count(MISSES_KEY, len(missing))
+        answers = defaultdict(list)
+        rows = VotingAnswer.objects.filter(voting__in=missing).order_by('id')
+        for voting_id, answer_id, text, votes in rows.values_list('voting', 'id', 'text', 'votes_total'):
+            answers[voting_id].append((answer_id, text, votes))
+        built = {results_key(voting): build_voting_results(voting, answers[voting.id]) for voting in missing}
+        cache.set_many(built, settings.RESULTS_CACHE_TIMEOUT)
+        cached.update(built)
+
+    return [cached[results_key(voting)] for voting in votings]
+
+
+async def acount(key):
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 0, None)
+        await cache.aincr(key)
+
+
+async def aget_voting_results(voting):
+    key = results_key(voting)
+    results = await cache.aget(key)
+    if results is None:
+        await acount(MISSES_KEY)
+        answers = [answer async for answer in answers_query(voting)]
+        results = build_voting_results(voting, answers)
+        await cache.aset(key, results, settings.RESULTS_CACHE_TIMEOUT)
+    else:
+        await acount(HITS_KEY)
+    return results
+
+
+def results_cache_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'backend': settings.CACHES['default']['BACKEND'],
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else None,
+    }
@@ -0,0 +1,109 @@
+import re
+
+from django.db import connections, router
+
+from .models import Voting
+from .pagination import PAGE_SIZE
+
+WORD = re.compile(r'\w+')
+
+# (table, column with the voting id, weight of a match), a match in the
+# question counts more than in an answer and much more than in a comment
+SEARCHED = (
+    ('simple_votings_app_voting', 'id', 1.0),
+    ('simple_votings_app_votinganswer', 'voting_id', 0.5),
+    ('simple_votings_app_comment', 'voting_id', 0.25),
+)
+
+# Only the newest matches of a table are ranked, bm25 costs tens of
+# microseconds a row and a common word matches a good part of the table
+RANKED_MATCHES = 500
+# Pages further than the ranked matches of the questions are not served,
+# later matches would be ranked among the newest ones only
+MAX_PAGES = RANKED_MATCHES // PAGE_SIZE
+
+# Every table gives its best `limit` matches as (voting_id, score) among
+# its newest RANKED_MATCHES ones, the votings are then ranked by their best
+# match. The tables are the FTS5 tables and GIN indexes created by migration
+# 0003_search_index.
+SQLITE_MATCHES = """
+    SELECT t.{column} AS voting_id, m.score * {weight} AS score
+    FROM (
+        SELECT rowid, bm25({table}_fts) AS score FROM {table}_fts
+        WHERE {table}_fts MATCH %(query)s AND rowid >= COALESCE((
+            SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %(query)s
+            ORDER BY rowid DESC LIMIT 1 OFFSET %(ranked)s
+        ), 0)
+        ORDER BY score LIMIT %(limit)s
+    ) AS m JOIN {table} AS t ON t.id = m.rowid
+"""
+SQLITE_SEARCH = """
+    SELECT voting_id FROM (
+        SELECT voting_id, MIN(score) AS score FROM ({matches}) GROUP BY voting_id
+    ) AS s JOIN simple_votings_app_voting AS v ON v.id = s.voting_id
+    WHERE NOT v.is_deleted
+    ORDER BY s.score, s.voting_id
+    LIMIT %(size)s OFFSET %(offset)s
+"""
+
+POSTGRESQL_MATCHES = """
+    SELECT * FROM (
+        SELECT {column} AS voting_id, ts_rank(to_tsvector('russian', text), q) * {weight} AS score
+        FROM {table}, websearch_to_tsquery('russian', %(query)s) AS q
+        WHERE to_tsvector('russian', text) @@ q AND id >= COALESCE((
+            SELECT id FROM {table} WHERE to_tsvector('russian', text) @@ websearch_to_tsquery('russian', %(query)s)
+            ORDER BY id DESC LIMIT 1 OFFSET %(ranked)s
+        ), 0)
+        ORDER BY score DESC LIMIT %(limit)s
+    ) AS m
+"""
+POSTGRESQL_SEARCH = """
+    SELECT voting_id FROM (
+        SELECT voting_id, MAX(score) AS score FROM ({matches}) AS m GROUP BY voting_id
+    ) AS s JOIN simple_votings_app_voting AS v ON v.id = s.voting_id
+    WHERE NOT v.is_deleted
+    ORDER BY s.score DESC, s.voting_id
+    LIMIT %(size)s OFFSET %(offset)s
+"""
+
+QUERIES = {
+    'sqlite': (SQLITE_MATCHES, SQLITE_SEARCH),
+    'postgresql': (POSTGRESQL_MATCHES, POSTGRESQL_SEARCH),
+}
+
+
+def fts_query(query):
+    # Every word must be present, the last one may be typed partly
+    words = ['"{}"'.format(word) for word in WORD.findall(query.lower())[:10]]
+    if words:
+        words[-1] += '*'
+    return ' '.join(words)
+
+
+def search_votings(query, page=1, size=PAGE_SIZE):
+    """Returns (votings, has_next) of a page of votings matching query by their question, answers or comments."""
+    connection = connections[router.db_for_read(Voting)]
+    if connection.vendor == 'sqlite':
+        query = fts_query(query)
+    if not query.strip():
+        return [], False
+
+    matches_sql, search_sql = QUERIES[connection.vendor]
+    offset = (page - 1) * size
+    # Enough matches of every table for the page, unless a lot of them
+    # belong to the same votings
+    limit = offset + size + 1
+
+    sql = search_sql.format(matches=' UNION ALL '.join(
+        matches_sql.format(table=table, column=column, weight=weight)
+        for table, column, weight in SEARCHED
+    ))
+    params = {'query': query, 'ranked': RANKED_MATCHES - 1, 'limit': limit, 'size': size + 1, 'offset': offset}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ids = [row[0] for row in cursor.fetchall()]
+
+    has_next = len(ids) > size
+    ids = ids[:size]
+    votings = Voting.objects.select_related('user').in_bulk(ids)
+    return [votings[voting_id] for voting_id in ids if voting_id in votings], has_next
@@ -1,3 +1,846 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from .avatars import process_avatar
+from .benchmarks import percentile
+from .cards import card_key
+from . import hot
+from .counters import rebuild_voting_counters, rebuild_profile_stats, rebuild_hot_scores
+from .counters import rebuild_vote_rollups, votes_created, delete_votes
+from .models import Vote, VotingAnswer, Voting
+from .models import Like, Comment, Profile, Report
+from .models import VoteRollup, vote_hour
+from .pagination import keyset_page
+from .live import LiveResultsApplication, live_results
+from .purge import soft_delete_voting, purge_voting
+from .replicas import ReplicaMiddleware, ReplicaRouter, STICKY_COOKIE, replica_allowed
+from .search import search_votings
+from .vote_buffer import VoteBuffer
+
+# Latency percentiles of every view are written there as JSON when set
+LATENCY_REPORT = os.environ.get('VIEW_LATENCY_REPORT')
+# A previous report, views whose median grew by more than the tolerance fail
+LATENCY_BASELINE = os.environ.get('VIEW_LATENCY_BASELINE')
+LATENCY_TOLERANCE = float(os.environ.get('VIEW_LATENCY_TOLERANCE', '1.5'))
+
+
+def seed(owner, voting_item, size):
+    """Adds size users who vote, like and comment on voting_item and size more votings."""
+    first = User.objects.count()
+    users = User.objects.bulk_create([
+        User(username='user{}'.format(first + i), last_login=timezone.now())
+        for i in range(size)
+    ])
+    Profile.objects.bulk_create([Profile(user=user) for user in users])
+
+    answers = list(voting_item.answers())
+    Vote.objects.bulk_create([
+        Vote(answer=answers[i % len(answers)], voting=voting_item, user=user)
+        for i, user in enumerate(users)
+    ])
+    Vote.objects.bulk_create([
+        Vote(answer=answers[0], voting=voting_item, user_ip='10.1.{}.{}'.format(n // 256, n % 256))
+        for n in range(first, first + size // 10)
+    ])
+    Like.objects.bulk_create([Like(voting=voting_item, user=user) for user in users])
+    Comment.objects.bulk_create([
+        Comment(voting=voting_item, user=user, text='Комментарий')
+        for user in users
+    ])
+
+    votings = Voting.objects.bulk_create([
+        Voting(text='Опрос', user=users[i % len(users)])
+        for i in range(size)
+    ])
+    VotingAnswer.objects.bulk_create([
+        VotingAnswer(text=text, voting=item)
+        for item in votings
+        for text in ('Да', 'Нет')
+    ])
+    Report.objects.bulk_create([
+        Report(voting=item, user=owner, message='Жалоба')
+        for item in votings
+    ])
+
+    rebuild_voting_counters()
+    rebuild_profile_stats()
+
+
+class ViewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_superuser('owner', 'owner@example.com', 'owner')
+        cls.owner.last_login = timezone.now()
+        cls.owner.save()
+        cls.voting = Voting.objects.create(text='Главный опрос', user=cls.owner)
+        VotingAnswer.objects.bulk_create([
+            VotingAnswer(text=text, voting=cls.voting)
+            for text in ('Да', 'Нет', 'Не знаю')
+        ])
+        seed(cls.owner, cls.voting, 5)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.owner)
+
+
+class ViewQueriesTest(ViewTestCase):
+    def assertQueriesBounded(self, request, bound):
+        """
+        Runs request before and after seeding twenty times more data, both
+        runs must make the same number of queries and no more than bound.
+        """
+        counts = []
+        for size in (None, 100):
+            if size is not None:
+                seed(self.owner, self.voting, size)
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = request()
+            self.assertLess(response.status_code, 400)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1], 'Number of queries grows with data')
+        self.assertLessEqual(counts[1], bound)
+
+    def test_index(self):
+        self.assertQueriesBounded(lambda: self.client.get('/'), 3)
+
+    def test_index_hot(self):
+        self.assertQueriesBounded(lambda: self.client.get('/', {'sort': 'hot'}), 3)
+
+    def test_voting(self):
+        self.assertQueriesBounded(lambda: self.client.get('/voting/{}/'.format(self.voting.id)), 7)
+
+    def test_voting_anonymous(self):
+        self.client.logout()
+        self.assertQueriesBounded(lambda: self.client.get('/voting/{}/'.format(self.voting.id)), 4)
+
+    def test_comment(self):
+        self.assertQueriesBounded(
+            lambda: self.client.post('/voting/{}/'.format(self.voting.id), {'comment': 'Ещё'}),
+            6
+        )
+
+    def test_vote(self):
+        answer = self.voting.answers().first()
+        clients = []
+        for i in range(2):
+            clients.append(self.client_class())
+            clients[-1].force_login(User.objects.create_user('voter{}'.format(i)))
+        clients = iter(clients)
+
+        def request():
+            return next(clients).post('/vote/{}/'.format(answer.id))
+
+        self.assertQueriesBounded(request, 13)
+
+    def test_vote_anonymous(self):
+        self.client.logout()
+        answer = self.voting.answers().first()
+        addresses = iter(('10.2.0.1', '10.2.0.2'))
+
+        def request():
+            return self.client.post('/vote/{}/'.format(answer.id), REMOTE_ADDR=next(addresses))
+
+        self.assertQueriesBounded(request, 10)
+
+    def test_like(self):
+        self.assertQueriesBounded(lambda: self.client.post('/like/{}/'.format(self.voting.id)), 8)
+
+    def test_profile(self):
+        self.assertQueriesBounded(lambda: self.client.get('/profile/{}/'.format(self.owner.id)), 7)
+
+    def test_reports(self):
+        self.assertQueriesBounded(lambda: self.client.get('/reports/'), 3)
+
+    def test_create(self):
+        def request():
+            return self.client.post('/create/', {'question': 'Новый опрос', 'answer': ['Да', 'Нет']})
+
+        self.assertQueriesBounded(request, 7)
+
+    def test_edit_page(self):
+        self.assertQueriesBounded(lambda: self.client.get('/voting/{}/edit/'.format(self.voting.id)), 5)
+
+    def test_edit(self):
+        answers = list(self.voting.answers().values_list('text', flat=True))
+        added = iter(('Может быть', 'Скорее нет'))
+
+        def request():
+            answers.append(next(added))
+            return self.client.post('/voting/{}/edit/'.format(self.voting.id), {
+                'question': self.voting.text,
+                'answer': answers,
+                'end_time': '',
+            })
+
+        self.assertQueriesBounded(request, 9)
+
+    def test_export(self):
+        def request():
+            response = self.client.get('/voting/{}/export/'.format(self.voting.id), {'format': 'ndjson'})
+            # The rows are read while the response is consumed
+            b''.join(response.streaming_content)
+            return response
+
+        self.assertQueriesBounded(request, 6)
+
+    def test_results(self):
+        self.assertQueriesBounded(lambda: self.client.get('/voting/{}/results/'.format(self.voting.id)), 4)
+
+    def test_timeline(self):
+        self.assertQueriesBounded(lambda: self.client.get('/voting/{}/timeline/'.format(self.voting.id)), 5)
+
+    def test_results_batch(self):
+        def request():
+            ids = Voting.objects.order_by('-id').values_list('id', flat=True)[:50]
+            return self.client.get('/results/', {'ids': ','.join(map(str, ids))})
+
+        self.assertQueriesBounded(request, 5)
+
+
+class ViewLatencyTest(ViewTestCase):
+    repeat = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        seed(cls.owner, cls.voting, 500)
+
+    def measure(self, request):
+        timings = []
+        for _ in range(self.repeat):
+            cache.clear()
+            start = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - start) * 1000)
+            self.assertLess(response.status_code, 400)
+        timings.sort()
+        return {
+            'p50': percentile(timings, 50),
+            'p95': percentile(timings, 95),
+            'p99': percentile(timings, 99),
+            'max': timings[-1],
+        }
+
+    def test_latency(self):
+        views = {
+            'index': lambda: self.client.get('/'),
+            'voting': lambda: self.client.get('/voting/{}/'.format(self.voting.id)),
+            'profile': lambda: self.client.get('/profile/{}/'.format(self.owner.id)),
+            'reports': lambda: self.client.get('/reports/'),
+            'edit': lambda: self.client.get('/voting/{}/edit/'.format(self.voting.id)),
+            'like': lambda: self.client.post('/like/{}/'.format(self.voting.id)),
+        }
+        report = {name: self.measure(request) for name, request in views.items()}
+
+        if LATENCY_REPORT:
+            with open(LATENCY_REPORT, 'w') as f:
+                json.dump({'repeat': self.repeat, 'views': report}, f, indent=2)
+
+        if LATENCY_BASELINE:
+            with open(LATENCY_BASELINE) as f:
+                baseline = json.load(f)['views']
+            for name, timings in report.items():
+                if name in baseline:
+                    with self.subTest(view=name):
+                        self.assertLessEqual(timings['p50'], baseline[name]['p50'] * LATENCY_TOLERANCE)
+
+
+class ProfileTest(ViewTestCase):
+    def test_user_save_keeps_counters(self):
+        user = User.objects.select_related('profile').get(id=self.owner.id)
+        Vote.objects.create(answer=self.voting.answers().first(), voting=self.voting, user=user)
+        votes = Profile.objects.get(user=user).votes_total
+
+        # As on login, with the profile loaded before the vote was counted
+        user.last_login = timezone.now()
+        user.save()
+        self.client.force_login(user)
+        self.assertEqual(Profile.objects.get(user=user).votes_total, votes)
+
+    def test_lists_are_paged(self):
+        votings = Voting.objects.bulk_create([Voting(text='Опрос', user=self.owner) for _ in range(25)])
+        Comment.objects.create(text='Комментарий', voting=votings[0], user=self.owner)
+        Like.objects.create(voting=votings[0], user=self.owner)
+        soft_delete_voting(votings[0])
+
+        response = self.client.get('/profile/{}/'.format(self.owner.id))
+        self.assertEqual(len(response.context['votings']), 20)
+        self.assertEqual(response.context['comments'], [])
+        self.assertEqual(response.context['likes'], [])
+        response = self.client.get('/profile/{}/'.format(self.owner.id), {'votings_after': response.context['next_votings']})
+        self.assertEqual(len(response.context['votings']), 25 - 20)
+        self.assertIsNone(response.context['next_votings'])
+
+
+class AvatarTest(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.profile = Profile.objects.get(user=self.owner)
+
+    def image(self, color):
+        data = BytesIO()
+        Image.new('RGB', (300, 200), color).save(data, 'PNG')
+        return data.getvalue()
+
+    def test_renditions(self):
+        name = default_storage.save('avatars/test.png', ContentFile(self.image('red')))
+        Profile.objects.filter(id=self.profile.id).update(avatar=name)
+        process_avatar(self.profile.id, name)
+
+        self.profile.refresh_from_db()
+        self.assertEqual(sorted(self.profile.avatar_renditions), sorted(str(size) for size in settings.AVATAR_SIZES))
+        for size in settings.AVATAR_SIZES:
+            with default_storage.open(self.profile.avatar_renditions[str(size)]) as file:
+                self.assertEqual(Image.open(file).size, (size, size))
+
+    def test_new_avatar_drops_old_renditions(self):
+        self.profile.avatar_renditions = {'64': 'avatars/old-64.webp'}
+        self.profile.save(update_fields=['avatar_renditions'])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post('/profile/{}/edit/'.format(self.owner.id), {
+                'avatar': SimpleUploadedFile('new.png', self.image('blue'), content_type='image/png'),
+            })
+        self.assertEqual(len(callbacks), 1)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.avatar_renditions, {})
+        self.assertEqual(self.profile.avatar_url(64), self.profile.avatar.url)
+
+
+class PurgeTest(ViewTestCase):
+    def profile_totals(self):
+        return list(Profile.objects.order_by('id').values_list(
+            'votings_total', 'votes_total', 'likes_total', 'comments_total',
+            'likes_on_votings_total', 'votes_on_votings_total',
+        ))
+
+    def test_purge(self):
+        rebuild_vote_rollups()
+        Vote.objects.create(answer=self.voting.answers().first(), voting=self.voting, user=self.owner)
+        self.assertTrue(VoteRollup.objects.filter(voting=self.voting).exists())
+
+        soft_delete_voting(self.voting)
+        with CaptureQueriesContext(connection) as queries:
+            purge_voting(self.voting.id, chunk_size=3, pause=0, progress=lambda *args: None)
+        # The rollups go first, the deleted votes have none to subtract from
+        self.assertFalse([query for query in queries.captured_queries
+                          if query['sql'].startswith('UPDATE "simple_votings_app_voterollup"')])
+
+        self.assertFalse(Voting.objects.filter(id=self.voting.id).exists())
+        for model in (Vote, VoteRollup, Like, Comment, Report, VotingAnswer):
+            self.assertFalse(model.objects.filter(voting=self.voting.id).exists(), model.__name__)
+        totals = self.profile_totals()
+        rebuild_profile_stats()
+        self.assertEqual(totals, self.profile_totals())
+
+
+class PaginationTest(ViewTestCase):
+    def test_rows_within_one_millisecond(self):
+        votings = Voting.objects.bulk_create([Voting(text='Опрос', user=self.owner) for _ in range(30)])
+        moment = timezone.now().replace(microsecond=123000)
+        for i, item in enumerate(votings):
+            Voting.objects.filter(id=item.id).update(start_time=moment + datetime.timedelta(microseconds=i * 10))
+
+        queryset = Voting.objects.filter(id__in=[item.id for item in votings])
+        ids, cursor = [], None
+        while True:
+            items, cursor = keyset_page(queryset, ('start_time', 'id'), cursor, size=7)
+            ids += [item.id for item in items]
+            if cursor is None:
+                break
+        self.assertEqual(ids, [item.id for item in reversed(votings)])
+
+    def test_comments_cross_pages(self):
+        voting_item = Voting.objects.create(text='Обсуждение', user=self.owner)
+        comments = Comment.objects.bulk_create([
+            Comment(text='Комментарий {}'.format(i), voting=voting_item, user=self.owner)
+            for i in range(45)
+        ])
+        # One timestamp for all, as for comments posted within a millisecond
+        Comment.objects.filter(voting=voting_item).update(date=timezone.now().replace(microsecond=123456))
+
+        ids, params = [], {}
+        while True:
+            response = self.client.get('/voting/{}/'.format(voting_item.id), params)
+            ids += [comment.id for comment in response.context['comments']]
+            if response.context['next_comments'] is None:
+                break
+            params = {'comments_after': response.context['next_comments']}
+        self.assertEqual(ids, [comment.id for comment in reversed(comments)])
+
+
+class ExportTest(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        Vote.objects.create(answer=self.voting.answers().first(), voting=self.voting, user_ip='10.9.0.1')
+
+    def test_csv(self):
+        response = self.client.get('/voting/{}/export/'.format(self.voting.id))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(lines[0], 'type,answer_id,answer,votes,date,user,ip')
+        self.assertEqual(len(lines), 1 + 3 + Vote.objects.filter(voting=self.voting).count())
+        self.assertTrue(lines[1].startswith('answer,'))
+        self.assertNotIn('10.9.0.1', '\n'.join(lines))
+
+    def test_ndjson(self):
+        response = self.client.get('/voting/{}/export/'.format(self.voting.id), {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        anonymous = [row for row in rows if row['type'] == 'vote' and not row['user']]
+        self.assertTrue(anonymous)
+        self.assertTrue(all(len(row['ip']) == 16 for row in anonymous))
+
+    def test_only_owner(self):
+        self.client.force_login(User.objects.create_user('stranger'))
+        response = self.client.get('/voting/{}/export/'.format(self.voting.id))
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(ROOT_URLCONF='simple_votings.asgi_urls')
+    async def test_streamed_on_asgi(self):
+        await self.async_client.aforce_login(self.owner)
+        response = await self.async_client.get('/voting/{}/export/'.format(self.voting.id))
+        self.assertTrue(response.is_async)
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        votes = await Vote.objects.filter(voting=self.voting).acount()
+        self.assertEqual(len(lines), 1 + 3 + votes)
+
+
+class ResultsTest(ViewTestCase):
+    def test_not_modified_until_vote(self):
+        url = '/voting/{}/results/'.format(self.voting.id)
+        votes = Vote.objects.filter(voting=self.voting).count()
+        response = self.client.get(url)
+        self.assertEqual(response.json()['votes'], votes)
+
+        with CaptureQueriesContext(connection) as queries:
+            repeated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeated.status_code, 304)
+        self.assertEqual(repeated.content, b'')
+        self.assertFalse([query for query in queries if 'votinganswer' in query['sql']])
+
+        Vote.objects.create(answer=self.voting.answers().first(), voting=self.voting, user_ip='10.9.0.2')
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertEqual(changed.json()['votes'], votes + 1)
+
+    def test_last_modified(self):
+        url = '/voting/{}/results/'.format(self.voting.id)
+        response = self.client.get(url)
+        repeated = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(repeated.status_code, 304)
+
+    def test_batch(self):
+        other = Voting.objects.create(text='Второй опрос', user=self.owner)
+        response = self.client.get('/results/', {'ids': '{},{},x,0'.format(other.id, self.voting.id)})
+        self.assertEqual([item['id'] for item in response.json()['votings']], [self.voting.id, other.id])
+        self.assertEqual(self.client.get('/results/', {'ids': '{},{}'.format(self.voting.id, other.id)},
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_missing(self):
+        self.assertEqual(self.client.get('/voting/0/results/').status_code, 404)
+
+
+@override_settings(LIVE_POLL_INTERVAL=0.01, LIVE_HEARTBEAT=0.05)
+class LiveResultsTest(ViewTestCase):
+    async def next_results(self, updates):
+        # Skips the heartbeats
+        while (results := await anext(updates)) is None:
+            pass
+        return results
+
+    async def test_pushes_changes_to_all_subscribers(self):
+        first, second = live_results.subscribe(self.voting.id), live_results.subscribe(self.voting.id)
+        results = await self.next_results(first)
+        self.assertEqual(await self.next_results(second), results)
+        self.assertEqual(len(live_results.watchers), 1)
+
+        answer = await self.voting.answers().afirst()
+        await Vote.objects.acreate(answer=answer, voting=self.voting, user_ip='10.9.0.3')
+        await Vote.objects.acreate(answer=answer, voting=self.voting, user_ip='10.9.0.4')
+        changed = await self.next_results(first)
+        if changed['votes'] == results['votes'] + 1:
+            changed = await self.next_results(first)
+        self.assertEqual(changed['votes'], results['votes'] + 2)
+
+        await first.aclose()
+        await second.aclose()
+        self.assertEqual(live_results.watchers, {})
+
+    async def test_ends_when_deleted(self):
+        updates = live_results.subscribe(self.voting.id)
+        await self.next_results(updates)
+        await sync_to_async(soft_delete_voting)(self.voting)
+        with self.assertRaises(StopAsyncIteration):
+            await self.next_results(updates)
+
+    async def request_events(self, path):
+        messages = []
+        received = asyncio.Event()
+
+        async def send(message):
+            messages.append(message)
+            if message['type'] == 'http.response.body':
+                received.set()
+
+        async def receive():
+            # The client leaves after the first event
+            await received.wait()
+            return {'type': 'http.disconnect'}
+
+        async def application(scope, receive, send):
+            self.fail('Passed to Django')
+
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'headers': []}
+        await LiveResultsApplication(application)(scope, receive, send)
+        return messages
+
+    async def test_event_stream(self):
+        start, event = await self.request_events('/voting/{}/events/'.format(self.voting.id))
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+        self.assertTrue(event['body'].startswith('id: {}\nevent: results\n'.format(self.voting.version).encode()))
+        self.assertEqual(live_results.watchers, {})
+
+    async def test_event_stream_of_missing_voting(self):
+        start, body = await self.request_events('/voting/0/events/')
+        self.assertEqual(start['status'], 404)
+
+
+class AsyncViewsTest(ViewTestCase):
+    # The async views of asgi_urls must answer and count as those of views.py do
+
+    async def send(self, client, method, path, **extra):
+        if isinstance(client, AsyncClient):
+            response = await getattr(client, method)(path, **extra)
+        else:
+            response = await sync_to_async(getattr(client, method))(path, **extra)
+        return response.status_code, response.get('Location')
+
+    async def scenario(self, registered, anonymous):
+        voting_item = await Voting.objects.acreate(text='Опрос', user=self.owner)
+        answer = await VotingAnswer.objects.acreate(text='Да', voting=voting_item)
+        voting_path, vote_path, like_path = (
+            '/voting/{}/'.format(voting_item.id), '/vote/{}/'.format(answer.id), '/like/{}/'.format(voting_item.id)
+        )
+        ip = {'headers': {'X-Forwarded-For': '10.6.0.1'}}
+        steps = [
+            (registered, 'get', voting_path, {}),
+            (registered, 'post', vote_path, {}),
+            (registered, 'post', vote_path, {}),
+            (anonymous, 'post', vote_path, ip),
+            (anonymous, 'post', vote_path, ip),
+            (registered, 'post', like_path, {}),
+            (anonymous, 'post', like_path, {}),
+            (registered, 'post', like_path, {}),
+            (registered, 'post', voting_path, {'data': {'comment': 'Комментарий'}}),
+            (anonymous, 'post', voting_path, {'data': {'comment': 'Комментарий'}}),
+        ]
+        results = []
+        for client, method, path, extra in steps:
+            status, location = await self.send(client, method, path, **extra)
+            await voting_item.arefresh_from_db()
+            await answer.arefresh_from_db()
+            results.append((
+                status,
+                location and location.replace(str(voting_item.id), '<voting>'),
+                voting_item.votes_total, answer.votes_total, voting_item.likes_total, voting_item.comments_total,
+            ))
+        return results
+
+    async def test_same_as_sync_views(self):
+        await self.async_client.aforce_login(self.owner)
+        expected = await self.scenario(self.client, Client())
+        with override_settings(ROOT_URLCONF='simple_votings.asgi_urls'):
+            self.assertEqual(await self.scenario(self.async_client, AsyncClient()), expected)
+        # The duplicate votes were refused
+        self.assertEqual([status for status, *_ in expected][1:5], [302, 409, 302, 409])
+
+
+class CardCacheTest(ViewTestCase):
+    def test_cached_until_changed(self):
+        self.client.get('/')
+        voting = Voting.objects.get(id=self.voting.id)
+        self.assertIsNotNone(cache.get(card_key(voting)))
+
+        Like.objects.create(voting=voting, user=User.objects.create_user('liker'))
+        voting.refresh_from_db()
+        self.assertIsNone(cache.get(card_key(voting)))
+        self.assertContains(self.client.get('/'), '&hearts; {}'.format(voting.likes_total))
+
+    def test_unchanged_cards_are_not_rendered(self):
+        self.client.get('/')
+        with self.assertTemplateNotUsed('voting_card.html'):
+            self.client.get('/')
+
+
+class HotScoreTest(ViewTestCase):
+    def score(self, voting):
+        return Voting.objects.values_list('hot_score', flat=True).get(id=voting.id)
+
+    def test_decays_by_half_life(self):
+        older = Voting.objects.create(text='Старый', user=self.owner, hot_score=0)
+        newer = Voting.objects.create(text='Новый', user=self.owner, hot_score=0)
+        half_life_ago = timezone.now() - datetime.timedelta(seconds=settings.HOT_HALF_LIFE)
+        Voting.objects.filter(id=older.id).update(hot_score=hot.hot_increment(4, half_life_ago))
+        Voting.objects.filter(id=newer.id).update(hot_score=hot.hot_increment(2))
+        self.assertAlmostEqual(self.score(older), self.score(newer), places=3)
+
+    def test_activity_ranks_first(self):
+        quiet = Voting.objects.create(text='Тихий', user=self.owner)
+        active = Voting.objects.create(text='Шумный', user=self.owner)
+        answer = VotingAnswer.objects.create(text='Да', voting=active)
+        Vote.objects.create(answer=answer, voting=active, user_ip='10.9.0.5')
+        Comment.objects.create(text='Ещё', voting=active, user=self.owner)
+
+        response = self.client.get('/', {'sort': 'hot'})
+        self.assertLess(response.content.index('Шумный'.encode()), response.content.index('Тихий'.encode()))
+        self.assertGreater(self.score(active), self.score(quiet))
+
+    def test_rebuild_matches_receivers(self):
+        since = timezone.now()
+        voting = Voting.objects.create(text='Опрос', user=self.owner)
+        answer = VotingAnswer.objects.create(text='Да', voting=voting)
+        Vote.objects.create(answer=answer, voting=voting, user=self.owner)
+        Like.objects.create(voting=voting, user=self.owner)
+        score = self.score(voting)
+
+        rebuild_hot_scores(since)
+        self.assertAlmostEqual(self.score(voting), score, places=3)
+
+
+class VoteRollupTest(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.answer = self.voting.answers().first()
+
+    def rollups(self):
+        return list(VoteRollup.objects.filter(voting=self.voting, votes__gt=0).values_list('answer', 'hour', 'votes'))
+
+    def test_kept_by_votes(self):
+        votes_before = Vote.objects.filter(answer=self.answer).count()
+        vote = Vote.objects.create(answer=self.answer, voting=self.voting, user_ip='10.9.0.6')
+        votes_created(Vote.objects.bulk_create([
+            Vote(answer=self.answer, voting=self.voting, user_ip='10.9.0.7'),
+            Vote(answer=self.answer, voting=self.voting, user_ip='10.9.0.8'),
+        ]))
+        # The seeded votes were inserted without signals
+        rollup = VoteRollup.objects.get(answer=self.answer, hour=vote_hour(vote.date))
+        self.assertEqual(rollup.votes, 3)
+
+        vote.delete()
+        delete_votes(Vote.objects.filter(user_ip='10.9.0.7'))
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.votes, 1)
+        self.assertEqual(Vote.objects.filter(answer=self.answer).count(), votes_before + 1)
+
+    def test_delete_spanning_hours(self):
+        rebuild_vote_rollups()
+        before = self.rollups()
+        votes = Vote.objects.bulk_create([
+            Vote(answer=self.answer, voting=self.voting, user_ip='10.9.1.{}'.format(i)) for i in range(3)
+        ])
+        votes_created(votes)
+        for i, vote in enumerate(votes):
+            Vote.objects.filter(id=vote.id).update(date=vote.date - datetime.timedelta(hours=i))
+        rebuild_vote_rollups()
+
+        with CaptureQueriesContext(connection) as queries:
+            delete_votes(Vote.objects.filter(id__in=[vote.id for vote in votes]))
+        rollup_queries = [query for query in queries.captured_queries if 'simple_votings_app_voterollup' in query['sql']]
+        self.assertEqual(len(rollup_queries), 1)
+        self.assertEqual(sorted(self.rollups()), sorted(before))
+
+    @override_settings(TIME_ZONE='Asia/Kolkata')
+    def test_hours_are_utc(self):
+        # Half an hour off UTC, local hours would start at other moments
+        rebuild_vote_rollups()
+        before = self.rollups()
+        vote = Vote.objects.create(answer=self.answer, voting=self.voting, user_ip='10.9.0.10')
+        incremental = self.rollups()
+        rebuild_vote_rollups()
+        self.assertEqual(sorted(self.rollups()), sorted(incremental))
+
+        delete_votes(Vote.objects.filter(id=vote.id))
+        self.assertEqual(sorted(self.rollups()), sorted(before))
+
+    def test_rebuild(self):
+        rebuild_vote_rollups(chunk_size=2)
+        rebuilt = self.rollups()
+        self.assertEqual(sum(votes for _, _, votes in rebuilt), Vote.objects.filter(voting=self.voting).count())
+
+        Vote.objects.create(answer=self.answer, voting=self.voting, user_ip='10.9.0.9')
+        incremental = self.rollups()
+        rebuild_vote_rollups()
+        self.assertEqual(sorted(self.rollups()), sorted(incremental))
+
+    def test_timeline(self):
+        rebuild_vote_rollups()
+        votes = Vote.objects.filter(voting=self.voting).count()
+        for granularity in ('hour', 'day'):
+            response = self.client.get('/voting/{}/timeline/'.format(self.voting.id), {'granularity': granularity})
+            answers = response.json()['answers']
+            self.assertEqual(len(answers), 3)
+            self.assertEqual(sum(votes for answer in answers for _, votes in answer['points']), votes)
+        response = self.client.get('/voting/{}/timeline/'.format(self.voting.id), {'granularity': 'week'})
+        self.assertEqual(response.status_code, 400)
+
+
+class VoteBufferTest(TransactionTestCase):
+    # The buffer writes from a thread of its own, it must see committed rows
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.voting = Voting.objects.create(text='Опрос', user=self.owner)
+        self.answer = VotingAnswer.objects.create(text='Да', voting=self.voting)
+        self.buffer = VoteBuffer(batch_size=10, flush_interval=0.05)
+        self.addCleanup(self.buffer.stop)
+
+    def vote(self, user=None, ip=''):
+        return Vote(answer=self.answer, voting=self.voting, user=user, user_ip=ip)
+
+    def test_drains_on_stop(self):
+        for n in range(25):
+            self.assertTrue(self.buffer.offer(self.vote(ip='10.8.0.{}'.format(n))))
+        self.buffer.stop()
+        self.voting.refresh_from_db()
+        self.assertEqual(self.voting.votes_total, 25)
+        self.assertEqual(Vote.objects.filter(voting=self.voting).count(), 25)
+
+        # Started again by the next vote
+        self.assertTrue(self.buffer.offer(self.vote(ip='10.8.1.0')))
+        self.buffer.stop()
+        self.assertEqual(Vote.objects.filter(voting=self.voting).count(), 26)
+
+    def test_stop_racing_votes(self):
+        # Votes offered while the buffer is being stopped are written all the same
+        offered = []
+
+        def offer():
+            for n in range(200):
+                if self.buffer.offer(self.vote(ip='10.7.{}.{}'.format(n // 256, n % 256))):
+                    offered.append(n)
+
+        thread = threading.Thread(target=offer)
+        thread.start()
+        while thread.is_alive():
+            self.buffer.stop()
+        self.buffer.stop()
+        self.assertEqual(Vote.objects.filter(voting=self.voting).count(), len(offered))
+        self.assertFalse(self.buffer.pending)
+
+    def test_dedup(self):
+        self.assertTrue(self.buffer.offer(self.vote(user=self.owner)))
+        self.assertFalse(self.buffer.offer(self.vote(user=self.owner)))
+        self.buffer.stop()
+        self.assertEqual(Vote.objects.filter(voting=self.voting).count(), 1)
+        self.assertFalse(self.buffer.pending)
+
+    def test_duplicates_from_elsewhere_are_dropped(self):
+        Vote.objects.create(answer=self.answer, voting=self.voting, user=self.owner)
+        other = User.objects.create_user('other')
+        # Voted through another process meanwhile, the batch fails and is inserted vote by vote
+        self.assertTrue(self.buffer.offer(self.vote(user=self.owner)))
+        self.assertTrue(self.buffer.offer(self.vote(user=other)))
+        self.buffer.stop()
+
+        self.assertEqual(Vote.objects.filter(voting=self.voting, user=self.owner).count(), 1)
+        self.assertEqual(Vote.objects.filter(voting=self.voting, user=other).count(), 1)
+        self.voting.refresh_from_db()
+        self.assertEqual(self.voting.votes_total, 2)
+        self.assertFalse(self.buffer.pending)
+
+
+class SearchTest(ViewTestCase):
+    def test_ranks_question_above_comments(self):
+        other = Voting.objects.create(text='Какой город выбрать?', user=self.owner)
+        Comment.objects.create(text='Мой город лучше', voting=self.voting, user=self.owner)
+        Voting.objects.create(text='Удалённый город', user=self.owner, is_deleted=True)
+
+        votings, has_next = search_votings('город')
+        self.assertEqual(votings, [other, self.voting])
+        self.assertFalse(has_next)
+
+    def test_last_word_is_prefix(self):
+        self.assertEqual(search_votings('главн')[0], [self.voting])
+        self.assertEqual(search_votings('главн опрос')[0], [])
+
+    def test_page(self):
+        response = self.client.get('/search/', {'q': 'Главный опрос'})
+        self.assertContains(response, 'Главный опрос')
+        response = self.client.get('/search/', {'q': '"*'})
+        self.assertContains(response, 'Ничего не найдено.')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRouterTest(SimpleTestCase):
+    # Only for the empty transaction, TestCase would run every test in one
+    databases = {'default'}
+
+    def route(self, request):
+        routes = []
+
+        def get_response(request):
+            routes.append(ReplicaRouter().db_for_read(Voting))
+            return HttpResponse()
+
+        response = ReplicaMiddleware(get_response)(request)
+        return routes[0], response
+
+    def test_commands_and_threads_read_default(self):
+        self.assertEqual(ReplicaRouter().db_for_read(Voting), 'default')
+
+    def test_get_reads_replica(self):
+        route, response = self.route(RequestFactory().get('/'))
+        self.assertEqual(route, 'replica1')
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_post_reads_default_and_sticks(self):
+        route, response = self.route(RequestFactory().post('/like/1/'))
+        self.assertEqual(route, 'default')
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        request = RequestFactory().get('/voting/1/')
+        request.COOKIES[STICKY_COOKIE] = response.cookies[STICKY_COOKIE].value
+        route, _ = self.route(request)
+        self.assertEqual(route, 'default')
+
+    def test_transaction_reads_default(self):
+        token = replica_allowed.set(True)
+        try:
+            with transaction.atomic():
+                self.assertEqual(ReplicaRouter().db_for_read(Voting), 'default')
+        finally:
+            replica_allowed.reset(token)
+
+    def test_writes_go_to_default(self):
+        self.assertEqual(ReplicaRouter().db_for_write(Voting), 'default')
+        self.assertFalse(ReplicaRouter().allow_migrate('replica1', 'simple_votings_app'))
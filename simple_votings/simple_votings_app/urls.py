@@ -15,13 +15,19 @@ urlpatterns = [
     path('login/', au_views.LoginView.as_view()),
     path('logout/', au_views.LogoutView.as_view()),
     path('register/', RegisterFormView.as_view()),
+    path('search/', search),
     path('profile/<int:user_id>/', profile),
     path('profile/<int:user_id>/edit/', edit_profile),
     path('voting/<int:voting_id>/edit/', voting_edit),
+    path('voting/<int:voting_id>/export/', export_voting),
+    path('voting/<int:voting_id>/results/', voting_results),
+    path('voting/<int:voting_id>/timeline/', voting_timeline),
+    path('results/', votings_results),
     path('delete/<int:voting_id>/', delete_voting),
     path('voting/<int:voting_id>/send_report/', send_report),
     path('reports/', reports),
     path('reports/<int:report_id>/delete/', close_report),
+    path('stats/cache/', cache_stats),
     path('login/pass-reset/', au_views.PasswordResetView.as_view(template_name='pass_reset.html'), name='pass-reset'),
     path('password_reset_confirm/<uidb64>/<token>/',
          au_views.PasswordResetConfirmView.as_view(template_name='password_reset_confirm.html'),
@@ -1,59 +1,165 @@
 import datetime
+import hashlib
 
-from django.db import transaction
+from django.conf import settings
+from django.db import transaction, router, IntegrityError
+from django.db.models import Sum
+from django.db.models.functions import TruncDay
 from django.contrib.auth.models import User
 from django.views.generic.edit import FormView
 from django.contrib.auth.forms import UserCreationForm
 from django.core.files.storage import FileSystemStorage
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import render, redirect, HttpResponse
+from django.http import Http404, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_safe
+from django.shortcuts import render, redirect, get_object_or_404, HttpResponse
 
 from .models import Vote, VotingAnswer, Voting
-from .models import Like, Comment, Profile, Report
+from .models import Like, Comment, Profile, Report, VoteRollup
+from .models import new_version
 from .forms import UserUpdateForm, ProfileUpdateForm, SignUpForm
 from .forms import AddCommentForm
-
-from PIL import Image
+from .pagination import keyset_page
+from .results import get_voting_results, get_many_voting_results, results_cache_stats
+from .vote_buffer import vote_buffer
+from .avatars import schedule_avatar_processing
+from .counters import delete_votes, delete_likes
+from .purge import soft_delete_voting
+from .search import search_votings, MAX_PAGES
+from .export import export_rows, FORMATS
+from .cards import render_cards
 
 
 # @login_required
 def voting(request, voting_id):
     context = {}
-    context['voting'] = Voting.objects.get(id=voting_id)
-    context['form'] = AddCommentForm()
-    context['voted_answers'] = []
-
-    try:
-        userlike = Like.objects.get(user=request.user, voting_id=context['voting'])
-    except:
-        userlike = None
-
-    if userlike:
-        context['liked_by_user'] = True
-    else:
-        context['liked_by_user'] = False
-
-    for i in context['voting'].answers():
-        for j in i.votes():
-            if j.user == request.user or (j.user_ip == get_client_ip(request) and not request.user.is_authenticated):
-                context['voted_answers'].append(i)
+    context['voting'] = get_object_or_404(Voting.objects.select_related('user'), id=voting_id, is_deleted=False)
 
     if request.method == 'POST':
-        form = AddCommentForm(request.POST)
         if not request.user.is_authenticated:
             return redirect('/login/')
 
+        form = AddCommentForm(request.POST)
         if form.is_valid():
-            comment_item = Comment(
-                text=form.data['comment'],
-                voting=Voting.objects.get(id=voting_id),
+            Comment.objects.create(
+                text=form.cleaned_data['comment'],
+                voting=context['voting'],
                 user=request.user
             )
-            comment_item.save()
+        return redirect('/voting/' + str(voting_id))
+
+    context['results'] = get_voting_results(context['voting'])
+    context['form'] = AddCommentForm()
+    context['voted_answers'] = set(voted_answer_ids(context['voting'], request.user, get_client_ip(request)))
+    context['liked_by_user'] = request.user.is_authenticated and Like.objects.filter(
+        user=request.user,
+        voting=context['voting']
+    ).exists()
+    context['comments'], context['next_comments'] = comments_page(context['voting'], request)
 
     return render(request, 'voting.html', context)
 
 
+# Votings one batch results request may ask for
+RESULTS_BATCH_SIZE = 100
+
+
+def requested_votings(request, voting_id=None):
+    # Looked up once for the ETag, Last-Modified and the response
+    if not hasattr(request, 'requested_votings'):
+        if voting_id is not None:
+            ids = [voting_id]
+        else:
+            ids = [item for item in request.GET.get('ids', '').split(',') if item.isdigit()][:RESULTS_BATCH_SIZE]
+        request.requested_votings = list(Voting.objects.filter(id__in=ids, is_deleted=False).order_by('id'))
+    return request.requested_votings
+
+
+def results_etag(request, voting_id=None):
+    votings = requested_votings(request, voting_id)
+    if not votings:
+        return None
+    # The version changes with every vote, like, comment and edit
+    versions = ','.join('{}.{}'.format(item.id, item.version) for item in votings)
+    return '"{}"'.format(hashlib.md5(versions.encode()).hexdigest())
+
+
+def results_last_modified(request, voting_id=None):
+    times = [item.change_time or item.start_time for item in requested_votings(request, voting_id)]
+    return max(times, default=None)
+
+
+@require_safe
+@cache_control(no_cache=True)
+@condition(etag_func=results_etag, last_modified_func=results_last_modified)
+def voting_results(request, voting_id):
+    votings = requested_votings(request, voting_id)
+    if not votings:
+        raise Http404
+    return JsonResponse(get_voting_results(votings[0]))
+
+
+@require_safe
+@cache_control(no_cache=True)
+@condition(etag_func=results_etag, last_modified_func=results_last_modified)
+def votings_results(request):
+    return JsonResponse({'votings': get_many_voting_results(requested_votings(request))})
+
+
+# Trunc functions of the rollup hours by granularity of a timeline
+TIMELINE_BUCKETS = {
+    'hour': None,
+    'day': TruncDay,
+}
+
+
+@require_safe
+@cache_control(no_cache=True)
+@condition(etag_func=results_etag, last_modified_func=results_last_modified)
+def voting_timeline(request, voting_id):
+    votings = requested_votings(request, voting_id)
+    if not votings:
+        raise Http404
+    granularity = request.GET.get('granularity', 'hour')
+    if granularity not in TIMELINE_BUCKETS:
+        return HttpResponse('Неизвестный шаг.', status=400)
+
+    # Reads only the rollups, as many rows as buckets whatever the number of votes
+    rollups = VoteRollup.objects.filter(voting=voting_id, votes__gt=0)
+    if TIMELINE_BUCKETS[granularity] is None:
+        rows = rollups.values_list('answer', 'hour', 'votes').order_by('hour')
+    else:
+        # UTC days, as the rollup hours are
+        bucket = TIMELINE_BUCKETS[granularity]('hour', tzinfo=datetime.timezone.utc)
+        rows = rollups.annotate(bucket=bucket).values_list('answer', 'bucket')
+        rows = rows.annotate(total=Sum('votes')).order_by('bucket')
+
+    answers = {
+        answer_id: {'id': answer_id, 'text': text, 'points': []}
+        for answer_id, text in VotingAnswer.objects.filter(voting=voting_id).order_by('id').values_list('id', 'text')
+    }
+    for answer_id, bucket, votes in rows:
+        answers[answer_id]['points'].append([bucket, votes])
+    return JsonResponse({'id': voting_id, 'granularity': granularity, 'answers': list(answers.values())})
+
+
+def comments_page(voting_item, request):
+    return keyset_page(
+        voting_item.comments().select_related('user__profile'),
+        ('date', 'id'),
+        request.GET.get('comments_after')
+    )
+
+
+def voted_answer_ids(voting_item, user, ip):
+    if user.is_authenticated:
+        votes = Vote.objects.filter(voting=voting_item, user=user)
+    else:
+        votes = Vote.objects.filter(voting=voting_item, user_ip=ip)
+    return votes.values_list('answer_id', flat=True)
+
+
 def get_client_ip(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
     if x_forwarded_for:
@@ -63,75 +169,72 @@ def get_client_ip(request):
     return ip
 
 
+def voter_votes(answer_item, **voter):
+    if answer_item.voting.is_multiple:
+        return Vote.objects.filter(answer=answer_item, **voter)
+    return Vote.objects.filter(voting=answer_item.voting_id, **voter)
+
+
+def new_vote(answer_item, user, ip):
+    return Vote(
+        answer=answer_item,
+        voting=answer_item.voting,
+        is_single=not answer_item.voting.is_multiple,
+        user=user,
+        user_ip=ip
+    )
+
+
+def store_vote(vote_item):
+    if settings.VOTE_BUFFER:
+        return vote_buffer.offer(vote_item)
+
+    try:
+        with transaction.atomic():
+            vote_item.save()
+    except IntegrityError:
+        # Someone with the same user or ip has voted in parallel
+        return False
+    return True
+
+
 @login_required
-def vote_registered(request, answer):
-    answer_item = VotingAnswer.objects.get(id=answer)
-    voting_item = answer_item.voting
-    ip = get_client_ip(request)
-
-    if voting_item.is_ended():
-        return
-
-    if not voting_item.is_multiple:
-        for answer in voting_item.answers():
-            if len(answer.votes().filter(user=request.user)) != 0:
-                return
-
-    if request.user not in [i.user for i in answer_item.votes()]:
-        vote_item = Vote(
-            answer=answer_item,
-            user=request.user,
-            user_ip=ip
-        )
-        vote_item.save()
+def vote_registered(request, answer_item):
+    voted = voter_votes(answer_item, user=request.user)
+    return cast_vote(request, answer_item, voted, user=request.user)
 
 
-def vote_anonymous(request, answer):
-    answer_item = VotingAnswer.objects.get(id=answer)
-    voting_item = answer_item.voting
-    ip = get_client_ip(request)
+def vote_anonymous(request, answer_item):
+    voted = voter_votes(answer_item, user_ip=get_client_ip(request))
+    return cast_vote(request, answer_item, voted)
 
-    if voting_item.is_ended():
-        return
 
-    if not voting_item.is_multiple:
-        for answer in voting_item.answers():
-            if len(answer.votes().filter(user_ip=ip)) != 0:
-                return
+def cast_vote(request, answer_item, voted, user=None):
+    if answer_item.voting.is_ended():
+        return HttpResponseForbidden('Голосование завершено.')
 
-    if ip not in [i.user_ip for i in answer_item.votes()]:
-        vote_item = Vote(
-            answer=answer_item,
-            user_ip=ip
-        )
-        vote_item.save()
+    if voted.exists() or not store_vote(new_vote(answer_item, user, get_client_ip(request))):
+        return HttpResponse('Вы уже проголосовали.', status=409)
+
+    return redirect('/voting/' + str(answer_item.voting_id))
 
 
 def vote(request, answer):
+    answer_item = get_object_or_404(VotingAnswer.objects.select_related('voting'), id=answer, voting__is_deleted=False)
     if request.method == 'POST':
         if request.user.is_authenticated:
-            vote_registered(request, answer)
-        else:
-            vote_anonymous(request, answer)
-    return redirect('/voting/' + str(VotingAnswer.objects.get(id=answer).voting.id))
+            return vote_registered(request, answer_item)
+        return vote_anonymous(request, answer_item)
+    return redirect('/voting/' + str(answer_item.voting_id))
 
 
 @login_required
 def like(request, voting_id):
     if request.method == 'POST':
-        voting_item = Voting.objects.get(id=voting_id)
-        if request.user not in [i.user for i in voting_item.likes()]:
-            like_item = Like(
-                voting=voting_item,
-                user=request.user
-            )
-            like_item.save()
-        else:
-            like_item = Like.objects.get(
-                voting=voting_item,
-                user=request.user
-            )
-            like_item.delete()
+        voting_item = get_object_or_404(Voting, id=voting_id, is_deleted=False)
+        deleted, _ = Like.objects.filter(voting=voting_item, user=request.user).delete()
+        if not deleted:
+            Like.objects.create(voting=voting_item, user=request.user)
 
     return redirect('/voting/' + str(voting_id))
 
@@ -177,14 +280,13 @@ def create_voting(request):
                 voting_item.is_multiple = True
             if request.POST.get('is_anonymous_allowed', None) is not None:
                 voting_item.is_anonymous_allowed = True
-            voting_item.save()
-
-            for answer in request.POST.getlist('answer'):
-                answer_item = VotingAnswer(
-                    text=answer,
-                    voting=voting_item
-                )
-                answer_item.save()
+
+            with transaction.atomic():
+                voting_item.save()
+                VotingAnswer.objects.bulk_create([
+                    VotingAnswer(text=answer, voting=voting_item)
+                    for answer in request.POST.getlist('answer')
+                ])
             return redirect('/voting/' + str(voting_item.id))
 
     return render(request, 'createvoting.html', context)
@@ -193,57 +295,49 @@ def create_voting(request):
 @login_required
 def voting_edit(request, voting_id):
     context = {}
-    context['voting'] = Voting.objects.get(id=voting_id)
+    context['voting'] = get_object_or_404(Voting, id=voting_id, is_deleted=False)
 
     if request.method == 'POST':
         context['errors'] = get_voting_errors(request)
 
         if len(context['errors']) == 0:
-            voting_item = Voting.objects.get(id=voting_id)
+            voting_item = context['voting']
             question = request.POST['question']
             answers = request.POST.getlist('answer')
             end_time = request.POST['end_time']
             is_multiple = request.POST.get('is_multiple', None)
             is_anonymous_allowed = request.POST.get('is_anonymous_allowed', None)
 
-            if voting_item.text != question:
-                voting_item.text = question
-                for answer in voting_item.answers():
-                    for vote in answer.votes():
-                        vote.delete()
-                for like_item in voting_item.likes():
-                    like_item.delete()
-
-            if not end_time:
-                voting_item.end_time = None
-            else:
-                voting_item.end_time = end_time
-
-            if is_multiple is None:
-                voting_item.is_multiple = False
-            else:
-                voting_item.is_multiple = True
-
-            if is_anonymous_allowed is None:
-                voting_item.is_anonymous_allowed = False
-            else:
-                voting_item.is_anonymous_allowed = True
-            voting_item.save()
-
-            for answer_item in voting_item.answers():
-                if answer_item.text not in answers:
-                    answer_item.delete()
-
-            for answer_item in voting_item.answers():
-                if answer_item.text in answers:
-                    answers.remove(answer_item.text)
-
-            for answer_text in answers:
-                answer_item = VotingAnswer(
-                    text=answer_text,
-                    voting=voting_item
-                )
-                answer_item.save()
+            question_changed = voting_item.text != question
+            voting_item.text = question
+            voting_item.end_time = end_time or None
+            voting_item.is_multiple = is_multiple is not None
+            voting_item.is_anonymous_allowed = is_anonymous_allowed is not None
+
+            # Answers whose text is still submitted are kept (with their votes),
+            # the rest are deleted and the texts left over become new answers
+            deleted_answers = []
+            for answer_id, answer_text in voting_item.answers().values_list('id', 'text'):
+                if answer_text in answers:
+                    answers.remove(answer_text)
+                else:
+                    deleted_answers.append(answer_id)
+
+            with transaction.atomic():
+                if question_changed:
+                    delete_votes(Vote.objects.filter(voting=voting_item))
+                    delete_likes(Like.objects.filter(voting=voting_item))
+                if deleted_answers:
+                    delete_votes(Vote.objects.filter(answer__in=deleted_answers))
+                    VotingAnswer.objects.filter(id__in=deleted_answers).delete()
+                VotingAnswer.objects.bulk_create([
+                    VotingAnswer(text=answer_text, voting=voting_item)
+                    for answer_text in answers
+                ])
+
+                # Counters are kept by the database, save only the edited fields
+                voting_item.save(update_fields=['text', 'start_time', 'end_time', 'is_multiple', 'is_anonymous_allowed'])
+                Voting.objects.filter(id=voting_id).update(**new_version())
 
             return redirect('/voting/' + str(voting_id))
 
@@ -253,23 +347,86 @@ def voting_edit(request, voting_id):
 @login_required
 def delete_voting(request, voting_id):
     if request.method == 'POST':
-        voting = Voting.objects.get(id=voting_id)
+        voting = get_object_or_404(Voting, id=voting_id, is_deleted=False)
         if request.user == voting.user or request.user.is_superuser:
-            voting.delete()
+            soft_delete_voting(voting)
 
     return redirect('/')
 
 
+@login_required
+def export_voting(request, voting_id):
+    voting_item = get_object_or_404(Voting, id=voting_id, is_deleted=False)
+    if request.user != voting_item.user and not request.user.is_superuser:
+        return HttpResponseForbidden('Ошибка.')
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in FORMATS:
+        return HttpResponse('Неизвестный формат.', status=400)
+
+    lines, content_type = FORMATS[export_format]
+    # The rows are read while the response is sent, after the middleware has
+    # left, so the database is chosen now
+    rows = export_rows(voting_item, router.db_for_read(Vote))
+    response = StreamingHttpResponse(lines(rows), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="voting-{}.{}"'.format(voting_id, export_format)
+    return response
+
+
+# Orders of the front page: newest first or hottest first (see hot.py)
+FEED_ORDERS = {
+    'new': ('start_time', 'id'),
+    'hot': ('hot_score', 'id'),
+}
+
+
 def index(request):
     context = {}
-    context['votings'] = Voting.objects.all()
+    sort = request.GET.get('sort')
+    context['sort'] = sort if sort in FEED_ORDERS else 'new'
+    context['votings'], context['next_cursor'] = keyset_page(
+        Voting.objects.filter(is_deleted=False).select_related('user'),
+        FEED_ORDERS[context['sort']],
+        request.GET.get('after')
+    )
+    context['cards'] = render_cards(context['votings'])
     return render(request, 'index.html', context)
 
 
+def search(request):
+    # Only the newest RANKED_MATCHES of every table are ranked, that is
+    # MAX_PAGES pages of results
+    context = {}
+    context['query'] = request.GET.get('q', '').strip()
+    try:
+        page = min(max(int(request.GET.get('page', 1)), 1), MAX_PAGES)
+    except ValueError:
+        page = 1
+
+    context['votings'], has_next = search_votings(context['query'], page)
+    context['cards'] = render_cards(context['votings'])
+    context['next_page'] = page + 1 if has_next and page < MAX_PAGES else None
+    return render(request, 'search.html', context)
+
+
+# Lists of the profile page by their ordering, each is paged on its own
+PROFILE_LISTS = {
+    'votings': ('start_time', 'id'),
+    'votes': ('date', 'id'),
+    'likes': ('date', 'id'),
+    'comments': ('date', 'id'),
+}
+
+
 def profile(request, user_id):
     context = {}
-    context['ufp'] = User.objects.get(id=user_id)
-    context['profile'] = Profile.objects.get(user=user_id)
+    context['profile'] = get_object_or_404(Profile.objects.select_related('user'), user=user_id)
+    context['ufp'] = context['profile'].user
+    for name, fields in PROFILE_LISTS.items():
+        context[name], context['next_' + name] = keyset_page(
+            getattr(context['profile'], name)(),
+            fields,
+            request.GET.get(name + '_after')
+        )
 
     return render(request, 'profile.html', context)
 
@@ -300,17 +457,18 @@ def edit_profile(request, user_id):
                     # Remove old avatar
                     if p.avatar.name != 'avatars/0.png':
                         fs.delete(p.avatar.path)
+                    for rendition in p.avatar_renditions.values():
+                        fs.delete(rendition)
 
                     # Save avatar
-                    fs.save(path, image)
+                    path = fs.save(path, image)
                     p.avatar = path
-                    p.save()
+                    p.avatar_renditions = {}
+                    p.save(update_fields=['avatar', 'avatar_renditions'])
 
-                    # Resize
-                    image = Image.open(p.avatar)
-                    size = (200, 200)
-                    image = image.resize(size, Image.ANTIALIAS)
-                    image.save(p.avatar.path)
+                    # Resize in the background once the new avatar is committed,
+                    # the upload itself is shown until then
+                    transaction.on_commit(lambda: schedule_avatar_processing(p.id, path))
                 else:
                     pass
             else:
@@ -318,11 +476,12 @@ def edit_profile(request, user_id):
         except Exception:
             pass
         p.show_email = False if request.POST.get('show_email') is None else True
-        p.save()
+        p.save(update_fields=['show_email'])
         profile_form = ProfileUpdateForm(request.POST, instance=Profile.objects.get(user=user_id))
         if user_form.is_valid() and profile_form.is_valid():
             user_form.save()
-            profile_form.save()
+            # Do not overwrite the statistics counters with the values loaded above
+            profile_form.instance.save(update_fields=ProfileUpdateForm.Meta.fields)
             return redirect('/profile/' + str(user_id))
     else:
         user_form = UserUpdateForm(instance=User.objects.get(id=user_id))
@@ -367,7 +526,7 @@ def send_report(request, voting_id):
         if len(context['errors']) == 0:
             report_item = Report(
                 user=request.user,
-                voting=Voting.objects.get(id=voting_id),
+                voting=get_object_or_404(Voting, id=voting_id, is_deleted=False),
                 message=request.POST['message']
             )
             report_item.save()
@@ -380,8 +539,8 @@ def send_report(request, voting_id):
 @login_required
 def reports(request):
     context = {}
-    context['reports'] = Report.objects.filter(closed=False)
-    context['user_reports'] = Report.objects.filter(user=request.user)
+    context['reports'] = Report.objects.filter(closed=False, voting__is_deleted=False).select_related('voting', 'user')
+    context['user_reports'] = Report.objects.filter(user=request.user, voting__is_deleted=False).select_related('voting')
 
     return render(request, 'reports.html', context)
 
@@ -395,3 +554,10 @@ def close_report(request, report_id):
         return redirect('/reports/')
 
     return HttpResponse('Ошибка.')
+
+
+@login_required
+def cache_stats(request):
+    if not request.user.is_superuser:
+        return HttpResponseForbidden('Ошибка.')
+    return JsonResponse(results_cache_stats())
@@ -0,0 +1,121 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction, IntegrityError
+
+from .counters import votes_created
+from .models import Vote
+
+logger = logging.getLogger(__name__)
+
+
+def dedup_key(vote):
+    voter = ('user', vote.user_id) if vote.user_id else ('ip', vote.user_ip)
+    if vote.is_single:
+        return ('voting', vote.voting_id) + voter
+    return ('answer', vote.answer_id) + voter
+
+
+class VoteBuffer:
+    """Accepts votes in memory and writes them to the database in batches.
+
+    Under SQLite every INSERT takes the database write lock, so inserting
+    hundreds of votes with one bulk_create is much cheaper than doing it
+    request by request. The unique constraints of Vote still guard against
+    duplicates coming from other processes.
+    """
+
+    def __init__(self, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.pending = set()
+        self.lock = threading.Lock()
+        # Held while a thread is stopped, so that the next one only starts
+        # once it has drained the queue; two threads would write at once
+        self.stop_lock = threading.Lock()
+        # (thread, its stop event)
+        self.thread = None
+        atexit.register(self.stop)
+
+    def start(self):
+        with self.stop_lock, self.lock:
+            if self.thread is not None:
+                return
+            stopping = threading.Event()
+            thread = threading.Thread(target=self.run, args=(stopping,), name='vote-buffer', daemon=True)
+            self.thread = thread, stopping
+            thread.start()
+
+    def stop(self):
+        # Drains the queue before returning
+        with self.stop_lock:
+            with self.lock:
+                if self.thread is None:
+                    return
+                thread, stopping = self.thread
+                self.thread = None
+            stopping.set()
+            thread.join()
+
+    def offer(self, vote):
+        """Queues the vote, returns False if the same voter has a vote waiting already."""
+        key = dedup_key(vote)
+        with self.lock:
+            if key in self.pending:
+                return False
+            self.pending.add(key)
+        self.queue.put(vote)
+        self.start()
+        return True
+
+    def take_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self, stopping):
+        try:
+            while not (stopping.is_set() and self.queue.empty()):
+                batch = self.take_batch()
+                if batch:
+                    self.flush(batch)
+        finally:
+            connection.close()
+
+    def flush(self, batch):
+        try:
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        Vote.objects.bulk_create(batch)
+                    votes_created(batch)
+                except IntegrityError:
+                    # Some voter has voted through another process, insert
+                    # one by one so that only the duplicates are dropped
+                    for vote in batch:
+                        try:
+                            with transaction.atomic():
+                                vote.save()
+                        except IntegrityError:
+                            pass
+        except Exception:
+            logger.exception('Could not write %d buffered votes', len(batch))
+        finally:
+            with self.lock:
+                self.pending.difference_update(dedup_key(vote) for vote in batch)
+
+
+vote_buffer = VoteBuffer(settings.VOTE_BUFFER_BATCH_SIZE, settings.VOTE_BUFFER_FLUSH_INTERVAL)